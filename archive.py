@@ -0,0 +1,367 @@
+# archive.py
+"""
+Chat archives: whole chat histories in one compact, compressed file.
+
+    archive.export("backup.cga", chats, app="vaidic")    # chats: any iterable of chat dicts
+    for chat in archive.iter_chats("backup.cga"): ...    # streaming, one chat in memory at a time
+    archive.index("backup.cga")                          # [{"id", "title", "offset", "length"}]
+    archive.open_chat("backup.cga", chat_id)             # one chat, read by seeking to it
+
+The apps show render_sidebar() for downloading and uploading archives. For backups
+and migrations of a whole history directory (srinidhi's history/, one client's
+subdirectory of vaidic's VAIDIC_CHATS_DIR) there is a command line:
+
+    python archive.py export history backup.cga
+    python archive.py import backup.cga restored/
+    python archive.py list backup.cga
+    python archive.py show backup.cga <chat id>
+
+Layout (integers big-endian):
+
+    b"CGA1" codec(1 byte: z = zlib, s = zstd)
+    [u32 length][compressed chat JSON]  ...one record per chat
+    u32 0                               end of records
+    [u32 length][compressed index JSON]
+    u64 index offset, b"CGAX"
+
+Each chat is compressed on its own, so a reader can decompress one chat
+without the others. Sequential readers stop at the zero length and never need
+the index, so iter_chats works on non-seekable streams such as uploads. The
+writer counts the bytes it writes, so export streams to non-seekable outputs
+too. zstd is used when the zstandard package is installed (ARCHIVE_CODEC=zlib
+forces zlib); either way the codec is recorded in the header.
+"""
+import argparse
+import importlib
+import io
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from contextlib import nullcontext
+
+from conversation import json_default
+
+MAGIC = b"CGA1"
+TRAILER = b"CGAX"
+ZLIB, ZSTD = b"z", b"s"
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+MAX_RECORD = 256 * 1024 * 1024    # refuse corrupt lengths instead of allocating them
+
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _zstd():
+    try:
+        return importlib.import_module("zstandard")
+    except ImportError:
+        return None
+
+
+def _default_codec():
+    if os.environ.get("ARCHIVE_CODEC", "zstd") == "zstd" and _zstd() is not None:
+        return ZSTD
+    return ZLIB
+
+
+class _Codec:
+    def __init__(self, codec):
+        if codec == ZLIB:
+            self.compress = lambda data: zlib.compress(data, ZLIB_LEVEL)
+            self.decompress = zlib.decompress
+        elif codec == ZSTD:
+            zstd = _zstd()
+            if zstd is None:
+                raise ArchiveError("archive is zstd-compressed; install the zstandard package to read it")
+            self.compress = zstd.ZstdCompressor(level=ZSTD_LEVEL).compress
+            self.decompress = zstd.ZstdDecompressor().decompress
+        else:
+            raise ArchiveError(f"unknown archive codec {codec!r}")
+
+
+def title_of(chat):
+    """The chat's title (kamal, vaidic) or name (mahesh)."""
+    return chat.get("title") or chat.get("name") or "Untitled Chat"
+
+
+# ------------------------------- #
+# WRITING
+# ------------------------------- #
+class Writer:
+    """Append chats to an archive; close() writes the index.
+
+        with archive.Writer(f, app="kamal") as w:
+            w.add({"id": ..., "title": ..., "messages": conversation})
+    """
+
+    def __init__(self, f, app=None, codec=None):
+        self._f = f
+        self._codec_id = codec or _default_codec()
+        self._codec = _Codec(self._codec_id)
+        self._meta = {"app": app, "created": time.time()}
+        self._entries = []
+        self._pos = 0
+        self._closed = False
+        self._write(MAGIC + self._codec_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+
+    def _write(self, data):
+        self._f.write(data)
+        self._pos += len(data)
+
+    def _record(self, value):
+        data = self._codec.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":"),
+                                               default=json_default).encode("utf-8"))
+        offset = self._pos
+        self._write(_U32.pack(len(data)) + data)
+        return offset, len(data)
+
+    def add(self, chat):
+        """Write one chat dict; returns its id (a new one if it had none)."""
+        chat_id = str(chat.get("id") or uuid.uuid4().hex)
+        if chat.get("id") != chat_id:
+            chat = dict(chat, id=chat_id)
+        offset, length = self._record(chat)
+        self._entries.append({"id": chat_id, "title": title_of(chat), "offset": offset, "length": length})
+        return chat_id
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._write(_U32.pack(0))
+        offset, _ = self._record({**self._meta, "chats": self._entries})
+        self._write(_U64.pack(offset) + TRAILER)
+
+
+def export(target, chats, app=None, codec=None):
+    """Write `chats` to `target` (a path or binary file); returns the chat count."""
+    if isinstance(target, (str, os.PathLike)):
+        directory = os.path.dirname(os.path.abspath(target))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                n = export(f, chats, app, codec)
+            os.replace(tmp, target)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return n
+    with Writer(target, app=app, codec=codec) as w:
+        for chat in chats:
+            w.add(chat)
+    return len(w._entries)
+
+
+# ------------------------------- #
+# READING
+# ------------------------------- #
+def _read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise ArchiveError("archive is truncated")
+    return data
+
+
+def _read_header(f):
+    head = _read_exact(f, len(MAGIC) + 1)
+    if head[:len(MAGIC)] != MAGIC:
+        raise ArchiveError("not a chat archive")
+    return _Codec(head[len(MAGIC):])
+
+
+def _read_record(f, codec):
+    """The next record's value, or None at the end of the chat records."""
+    (length,) = _U32.unpack(_read_exact(f, _U32.size))
+    if length == 0:
+        return None
+    if length > MAX_RECORD:
+        raise ArchiveError("archive record is too large (corrupt archive?)")
+    data = _read_exact(f, length)
+    try:
+        return json.loads(codec.decompress(data))
+    except Exception as e:    # zlib.error, zstd.ZstdError, ValueError
+        raise ArchiveError(f"archive record is corrupt: {e}") from e
+
+
+def _opened(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    return nullcontext(source)    # the caller's file; the caller closes it
+
+
+def iter_chats(source):
+    """Yield the chat dicts in `source` (a path or binary file) in order."""
+    with _opened(source) as f:
+        codec = _read_header(f)
+        while True:
+            chat = _read_record(f, codec)
+            if chat is None:
+                return
+            yield chat
+
+
+def _read_index(f):
+    f.seek(-(_U64.size + len(TRAILER)), io.SEEK_END)
+    tail = _read_exact(f, _U64.size + len(TRAILER))
+    if tail[_U64.size:] != TRAILER:
+        raise ArchiveError("archive has no index (truncated?)")
+    f.seek(0)
+    codec = _read_header(f)
+    f.seek(_U64.unpack(tail[:_U64.size])[0])
+    return codec, _read_record(f, codec)
+
+
+def index(source):
+    """The archive's chat list, [{"id", "title", "offset", "length"}], without reading the chats."""
+    with _opened(source) as f:
+        return _read_index(f)[1]["chats"]
+
+
+def info(source):
+    """Archive metadata: {"app", "created", "chats"}."""
+    with _opened(source) as f:
+        return _read_index(f)[1]
+
+
+def open_chat(source, chat_id):
+    """One chat by id (or None), decompressing only that chat."""
+    with _opened(source) as f:
+        codec, meta = _read_index(f)
+        for entry in meta["chats"]:
+            if entry["id"] == chat_id:
+                f.seek(entry["offset"])
+                return _read_record(f, codec)
+    return None
+
+
+# ------------------------------- #
+# STREAMLIT
+# ------------------------------- #
+def render_sidebar(app, chats, add):
+    """Sidebar expander to download the session's chats and import an archive.
+
+    `chats` is called for the chat dicts only when an export is requested;
+    `add(chat)` is called for every chat of an uploaded archive.
+    """
+    import streamlit as st
+
+    ss = st.session_state
+    with st.sidebar.expander("📦 Export / import chats", expanded=False):
+        if st.button("Prepare export", key="archive_export"):
+            buf = io.BytesIO()
+            n = export(buf, chats(), app=app)
+            ss["_archive_export"] = (buf.getvalue(), n)
+        if ss.get("_archive_export"):
+            data, n = ss["_archive_export"]
+            st.download_button(
+                f"⬇️ Download {n} chats ({len(data) // 1024 + 1} KB)",
+                data,
+                file_name=f"{app}-chats-{time.strftime('%Y%m%d-%H%M')}.cga",
+                mime="application/octet-stream",
+            )
+        upload = st.file_uploader("Import an archive", type=["cga"], key="archive_upload")
+        marker = upload and (upload.name, upload.size)
+        if upload is not None and ss.get("_archive_imported") != marker:
+            ss["_archive_imported"] = marker
+            n = 0
+            try:
+                for chat in iter_chats(upload):
+                    add(chat)
+                    n += 1
+                ss["_archive_notice"] = ("success", f"Imported {n} chats")
+            except ArchiveError as e:
+                ss["_archive_notice"] = ("error", f"❌ Import failed after {n} chats: {e}")
+            st.rerun()    # the chat lists above were drawn before the import
+        notice = ss.pop("_archive_notice", None)
+        if notice:
+            getattr(st, notice[0])(notice[1])
+
+
+# ------------------------------- #
+# COMMAND LINE (history directories)
+# ------------------------------- #
+def read_dir(path):
+    """Chat dicts from a directory of JSON chat files, one file at a time.
+
+    Files holding a bare message list (srinidhi) become {"id": name,
+    "title": name, "messages": [...]}.
+    """
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(path, name), encoding="utf-8") as f:
+            data = json.load(f)
+        stem = name[:-len(".json")]
+        if isinstance(data, list):
+            data = {"id": stem, "title": stem, "messages": data}
+        yield data
+
+
+def write_dir(chats, path):
+    os.makedirs(path, exist_ok=True)
+    n = 0
+    for chat in chats:
+        name = os.path.basename(str(chat["id"])) or uuid.uuid4().hex    # ids come from the archive
+        with open(os.path.join(path, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(chat, f, ensure_ascii=False, separators=(",", ":"))
+        n += 1
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="archive a directory of JSON chats")
+    p.add_argument("directory")
+    p.add_argument("archive")
+    p.add_argument("--app")
+    p = sub.add_parser("import", help="unpack an archive into a directory of JSON chats")
+    p.add_argument("archive")
+    p.add_argument("directory")
+    p = sub.add_parser("list", help="list the chats in an archive")
+    p.add_argument("archive")
+    p = sub.add_parser("show", help="print one chat as JSON")
+    p.add_argument("archive")
+    p.add_argument("chat_id")
+    args = ap.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            print(f"{export(args.archive, read_dir(args.directory), app=args.app)} chats -> {args.archive}")
+        elif args.command == "import":
+            print(f"{write_dir(iter_chats(args.archive), args.directory)} chats -> {args.directory}")
+        elif args.command == "list":
+            for entry in index(args.archive):
+                print(f"{entry['id']}\t{entry['title']}")
+        else:
+            chat = open_chat(args.archive, args.chat_id)
+            if chat is None:
+                print(f"no chat {args.chat_id!r} in {args.archive}", file=sys.stderr)
+                return 1
+            json.dump(chat, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+    except (OSError, ArchiveError) as e:
+        print(f"archive: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Offline benchmarks and load tests for the chat apps (see bench/run.py)."""
@@ -0,0 +1,56 @@
+# bench/apps.py
+"""
+Load the functions defined in an app script without running its page.
+
+The apps are Streamlit scripts: importing one renders the whole UI and touches
+session state. For benchmarking we only want their helpers, so this keeps the
+script's imports, UPPER_CASE constants and top-level functions and drops
+everything else.
+"""
+import ast
+import io
+import os
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_loaded = {}
+
+
+def _keep(node):
+    if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef)):
+        return True
+    if isinstance(node, ast.Assign):
+        return all(isinstance(t, ast.Name) and t.id.isupper() for t in node.targets)
+    return False
+
+
+def load(app):
+    """Return a module-like namespace with the helpers of `<app>.py`."""
+    if app in _loaded:
+        return _loaded[app]
+    path = os.path.join(ROOT, f"{app}.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    tree.body = [n for n in tree.body if _keep(n)]
+    module = types.ModuleType(f"bench_app_{app}")
+    module.__file__ = path
+    exec(compile(tree, path, "exec"), module.__dict__)
+    _loaded[app] = module
+    return module
+
+
+class Upload(io.BytesIO):
+    """An in-memory upload with the attributes the apps read from Streamlit's UploadedFile."""
+
+    TYPES = {".pdf": "application/pdf", ".png": "image/png", ".jpg": "image/jpeg",
+             ".jpeg": "image/jpeg", ".csv": "text/csv", ".txt": "text/plain"}
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        super().__init__(data)
+        self.name = os.path.basename(path)
+        self.type = self.TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+        self.size = len(data)
+        self.file_id = f"{self.name}:{self.size}"
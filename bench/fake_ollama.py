@@ -0,0 +1,176 @@
+# bench/fake_ollama.py
+"""
+A stand-in Ollama server for benchmarks and load tests.
+
+Implements the parts of the REST API the apps use (/api/generate, /api/chat,
+streamed or not, /api/tags) and answers with filler tokens at a configurable
+rate, after a configurable first-token delay, failing a configurable share of
+requests. Token counts and durations are reported the way Ollama reports them.
+
+    python -m bench.fake_ollama --port 11434 --tps 40 --first-token 0.3 --error-rate 0.02
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the model answers with filler text so that timing is realistic while "
+         "content stays cheap to produce def return print for while class import").split()
+
+
+class FakeConfig:
+    def __init__(self, tokens_per_s=50.0, first_token_delay=0.2, error_rate=0.0,
+                 answer_tokens=64, prompt_tokens_per_s=500.0, seed=None):
+        self.tokens_per_s = tokens_per_s
+        self.first_token_delay = first_token_delay
+        self.error_rate = error_rate
+        self.answer_tokens = answer_tokens
+        self.prompt_tokens_per_s = prompt_tokens_per_s
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            return self.rng.random() < self.error_rate
+
+
+def _prompt_tokens(body):
+    if "messages" in body:
+        text = " ".join(m.get("content", "") for m in body["messages"])
+    else:
+        text = body.get("prompt", "")
+    # Roughly one token per 4 characters; the context array is already tokens
+    return max(1, len(text) // 4) + len(body.get("context") or [])
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "tinyllama"}, {"name": "llama2"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json(404, {"error": "not found"})
+            return
+        cfg = self.config
+        if cfg.should_fail():
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        chat = self.path == "/api/chat"
+        n_prompt = _prompt_tokens(body)
+        cap = int((body.get("options") or {}).get("num_predict") or -1)
+        n_answer = cfg.answer_tokens if cap < 0 else min(cap, cfg.answer_tokens)
+        done_reason = "length" if 0 <= cap < cfg.answer_tokens else "stop"
+        prefill = n_prompt / cfg.prompt_tokens_per_s
+        start = time.monotonic()
+        time.sleep(cfg.first_token_delay + prefill)
+        first = time.monotonic()
+
+        def chunk(text, done, eval_s=0.0):
+            out = {"model": body.get("model", "fake"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                   "done": done}
+            if chat:
+                out["message"] = {"role": "assistant", "content": text}
+            else:
+                out["response"] = text
+            if done:
+                out.update({
+                    "done_reason": done_reason,
+                    "total_duration": int((time.monotonic() - start) * 1e9),
+                    "load_duration": 0,
+                    "prompt_eval_count": n_prompt,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_count": n_answer,
+                    "eval_duration": int(eval_s * 1e9),
+                })
+                if not chat:
+                    out["context"] = list(range(n_prompt + n_answer))
+            return out
+
+        words = [cfg.rng.choice(WORDS) for _ in range(n_answer)]
+        per_token = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s else 0.0
+
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for w in words:
+                    self._write_chunk(chunk(w + " ", False))
+                    time.sleep(per_token)
+                self._write_chunk(chunk("", True, time.monotonic() - first))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client went away mid-stream (cancelled request)
+                self.close_connection = True
+        else:
+            time.sleep(per_token * n_answer)
+            self._send_json(200, chunk(" ".join(words), True, time.monotonic() - first))
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def start(port=0, **config):
+    """Start a fake server on a background thread; returns (server, base_url)."""
+    handler = type("ConfiguredHandler", (Handler,), {"config": FakeConfig(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def use(url):
+    """Point the router at the fake server. Must run before model_router is imported."""
+    os.environ["OLLAMA_BACKENDS"] = json.dumps([
+        {"host": url, "model": "tinyllama", "tasks": ["chat", "draft"]},
+        {"host": url, "model": "llama2", "tasks": ["chat", "long", "code", "summarize", "research"]},
+    ])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--tps", type=float, default=50.0, help="generated tokens per second")
+    ap.add_argument("--first-token", type=float, default=0.2, help="seconds before the first token")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 500")
+    ap.add_argument("--answer-tokens", type=int, default=64)
+    args = ap.parse_args()
+    server, url = start(args.port, tokens_per_s=args.tps, first_token_delay=args.first_token,
+                        error_rate=args.error_rate, answer_tokens=args.answer_tokens)
+    print(f"fake Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench/fixtures.py
+"""
+Fixture corpus for the benchmarks: PDFs, code screenshots and CSVs.
+
+Files are generated into a directory on first use so nothing binary lives in
+git. Point --corpus at a directory of real uploads to benchmark those instead;
+files are picked up by extension.
+"""
+import csv
+import os
+import random
+
+CODE_SAMPLE = '''def fibonacci(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+class Stack:
+    def __init__(self):
+        self.items = []
+
+    def push(self, item):
+        self.items.append(item)
+
+for i in range(10):
+    print(i, fibonacci(i))
+'''
+
+PROSE = ("Operating systems manage processes, memory and devices. A process is a program "
+         "in execution; the scheduler decides which ready process runs next. Paging splits "
+         "memory into fixed-size frames so that a process need not be contiguous. ")
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Write a minimal text PDF (one Helvetica text block per page) without any PDF library."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 11 Tf", "14 TL", "50 780 Td"]
+        ops += [f"({_pdf_escape(line)}) '" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        body = obj if isinstance(obj, bytes) else obj.encode()
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{off:010d} 00000 n \n" for off in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_screenshot(path, text, scale=2):
+    """Render monospaced text onto a white PNG, like a code screenshot."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    lines = text.splitlines()
+    try:
+        font = ImageFont.truetype("DejaVuSansMono.ttf", 14 * scale)
+    except OSError:
+        font = ImageFont.load_default()
+    line_h = 18 * scale
+    width = max(len(line) for line in lines) * 9 * scale + 40 * scale
+    img = Image.new("RGB", (width, line_h * len(lines) + 40 * scale), "white")
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((20 * scale, 20 * scale + i * line_h), line, fill="black", font=font)
+    img.save(path)
+
+
+def write_csv(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["student_id", "name", "marks", "grade"])
+        for i in range(rows):
+            marks = rng.randint(0, 100)
+            w.writerow([i, f"student{i}", marks, "ABCDF"[min(4, (100 - marks) // 15)]])
+
+
+def build(directory):
+    """Generate the default corpus into `directory` (skipping files that exist)."""
+    os.makedirs(directory, exist_ok=True)
+    specs = {
+        "notes_2p.pdf": lambda p: write_pdf(p, [[PROSE[:90], PROSE[90:180]]] * 2),
+        "assignment_20p.pdf": lambda p: write_pdf(p, [[f"Q{i}. " + PROSE[:80]] * 40 for i in range(20)]),
+        "code_small.png": lambda p: write_screenshot(p, CODE_SAMPLE, scale=1),
+        "code_page.png": lambda p: write_screenshot(p, CODE_SAMPLE * 4, scale=2),
+        "marks_100.csv": lambda p: write_csv(p, 100),
+        "marks_10k.csv": lambda p: write_csv(p, 10_000),
+    }
+    for name, make in specs.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            try:
+                make(path)
+            except ImportError:
+                pass  # e.g. no Pillow: the image scenarios find nothing and skip
+    return directory
+
+
+def files(directory, *extensions):
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                  if f.lower().endswith(extensions))
@@ -0,0 +1,80 @@
+# bench/import_report.py
+"""
+Cold-import cost of each app script's top-level imports, and of the heavy
+modules the apps load lazily.
+
+Every module is timed in a fresh interpreter with `python -X importtime`, so
+the numbers are what a new Streamlit worker pays before its first paint.
+
+    python -m bench.import_report                 # all apps
+    python -m bench.import_report kamal --json out.json
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+from bench.apps import ROOT
+
+APPS = ("kamal", "srinidhi", "vaidic", "mahesh")
+LAZY = ("pandas", "PyPDF2", "PIL.Image", "pytesseract", "speech_recognition", "vosk", "fitz")
+
+
+def top_level_imports(app):
+    with open(os.path.join(ROOT, f"{app}.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names.append(node.module)
+    return list(dict.fromkeys(names))
+
+
+def import_cost(module):
+    """Cumulative microseconds to import `module` cold, or None if it is not installed."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return None
+    # Lines look like "import time:   self [us] | cumulative | imported package";
+    # the requested module is the last line at the outermost nesting level.
+    for line in reversed(proc.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1])
+    return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("apps", nargs="*", default=list(APPS), help=f"any of {', '.join(APPS)}")
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args(argv)
+    unknown = set(args.apps) - set(APPS)
+    if unknown:
+        ap.error(f"unknown app(s): {', '.join(sorted(unknown))}")
+
+    report = {}
+    for app in args.apps:
+        report[app] = {m: import_cost(m) for m in top_level_imports(app)}
+    report["lazy"] = {m: import_cost(m) for m in LAZY}
+
+    for section, costs in report.items():
+        known = [c for c in costs.values() if c is not None]
+        print(f"\n{section}  (total {sum(known) / 1000:.0f} ms)")
+        for module, us in sorted(costs.items(), key=lambda kv: -(kv[1] or 0)):
+            print(f"  {module:<22}{'not installed' if us is None else f'{us / 1000:8.1f} ms'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+# bench/loadtest.py
+"""
+Headless load generator: N synthetic students hitting the chat apps at once.
+
+Text turns go through the real pages with Streamlit's AppTest. Every user runs
+in its own process: AppTest creates and tears down Streamlit's process-wide
+Runtime, so two AppTests cannot run side by side in one process. AppTest cannot drive file uploads,
+so image+OCR and PDF turns call the same helpers the pages call on upload.
+
+    python -m bench.loadtest --users 40 --ramp linear --ramp-time 30 --duration 120
+    python -m bench.loadtest --app srinidhi --mix text=6,image=3,pdf=1 --real
+
+By default model calls go to bench.fake_ollama; --real keeps OLLAMA_BACKENDS
+(or the local server) so the numbers are capacity numbers for real hardware.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from bench import apps, fake_ollama, fixtures
+from bench.apps import Upload
+from bench.run import percentile
+
+QUESTIONS = [
+    "What is a deadlock?",
+    "Explain paging vs segmentation.",
+    "Write a python function to reverse a linked list.",
+    "Why does my for loop print one extra number?",
+    "Summarize the difference between TCP and UDP in three bullet points.",
+]
+
+
+# ------------------------------- #
+# PAGE DRIVERS (text turns through AppTest)
+# ------------------------------- #
+def _send_vaidic(at, text):
+    at.text_input(key="user_input").input(text).run()
+
+
+def _send_srinidhi(at, text):
+    at.text_input(key="input_text").input(text)
+    next(b for b in at.button if b.label == "➤").click().run()
+
+
+def _send_mahesh(at, text):
+    if not at.chat_input:
+        next(b for b in at.sidebar.button if b.label == "New Chat").click().run()
+    at.chat_input[0].set_value(text).run()
+
+
+def _send_kamal(at, text):
+    at.chat_input[0].set_value(text).run()
+
+
+PAGES = {"vaidic": _send_vaidic, "srinidhi": _send_srinidhi, "mahesh": _send_mahesh, "kamal": _send_kamal}
+
+
+def _replies(at):
+    """Texts of the assistant messages in the page's current chat."""
+    ss = at.session_state
+    if "chats" in ss:    # kamal, mahesh
+        chat = ss["chats"].get(ss["current_chat"])
+        messages = chat["messages"] if chat else ()
+    else:                # vaidic, srinidhi
+        messages = ss["messages"]
+    replies = []
+    for m in messages:
+        role, content = (m["role"], m["content"]) if isinstance(m, dict) else (m.role, m.content)
+        if role == "assistant":
+            replies.append(content)
+    return replies
+
+
+def _turn_ok(at, before):
+    """Did the turn add a real answer? `before` is the reply count before sending.
+
+    The pages never raise on a model failure: they show st.error or put a
+    "⚠️ ..." message in the chat instead of the answer, or add nothing.
+    """
+    if at.exception or at.error:
+        return False
+    replies = _replies(at)
+    return len(replies) > before and not replies[-1].startswith("⚠️")
+
+
+# ------------------------------- #
+# UPLOAD TURNS (direct helper calls)
+# ------------------------------- #
+# The page helpers report failures as text, not exceptions, so the turns
+# check what they return; model calls raise ollama_client.OllamaError
+def _image_turn(corpus, rng):
+    app = apps.load("kamal")
+    images = fixtures.files(corpus, ".png", ".jpg", ".jpeg")
+    if not images:
+        raise RuntimeError("no images in corpus")
+    text = app.perform_ocr(Upload(rng.choice(images)))
+    if text.startswith("OCR failed"):
+        raise RuntimeError(text)
+    text = app.clean_ocr_code(text)
+    app.call_ollama_once("You are CodeGene AI.", f"Fix this code:\n{text}",
+                         task="code" if app.looks_like_code(text) else "long")
+
+
+def _pdf_turn(corpus, rng):
+    app = apps.load("srinidhi")
+    ctx = app.extract_from_pdf(Upload(rng.choice(fixtures.files(corpus, ".pdf"))))
+    if not ctx:
+        raise RuntimeError("PDF extraction failed")
+    messages = [{"role": "user", "content": f"CONTEXT:\n{ctx}\n\nQUESTION: summarize this"}]
+    if not "".join(chunk.text for chunk in app.model_stream(messages, task="long")):
+        raise RuntimeError("empty reply")
+
+
+# ------------------------------- #
+# USERS AND RAMP-UP
+# ------------------------------- #
+class Results:
+    """Collects (scenario, seconds, ok) samples; the user processes send theirs over a queue."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, scenario, seconds, ok):
+        if ok:
+            self.samples[scenario].append(seconds)
+        else:
+            self.errors[scenario] += 1
+
+    def report(self):
+        rows = {}
+        for scenario in sorted(set(self.samples) | set(self.errors)):
+            s = self.samples[scenario]
+            total = len(s) + self.errors[scenario]
+            rows[scenario] = {
+                "requests": total,
+                "error_rate": self.errors[scenario] / total if total else 0.0,
+                "p50": percentile(s, 0.50),
+                "p95": percentile(s, 0.95),
+                "p99": percentile(s, 0.99),
+            }
+        return rows
+
+
+def start_delay(i, users, ramp, ramp_time):
+    """Seconds after the start at which user i joins."""
+    if ramp == "constant" or users <= 1:
+        return 0.0
+    if ramp == "linear":
+        return ramp_time * i / users
+    # step: four equal batches
+    return ramp_time * (i * 4 // users) / 4
+
+
+def user_loop(i, delay, args, corpus, mix, deadline, samples):
+    """One simulated user, run in its own process; puts (scenario, seconds, ok) on `samples`."""
+    def add(scenario, seconds, ok):
+        samples.put((scenario, seconds, ok))
+
+    if args.app == "srinidhi":
+        # srinidhi saves every chat under the relative history/ directory;
+        # keep the synthetic ones out of the real history
+        sys.path.insert(0, apps.ROOT)    # the app modules, whatever the cwd
+        with tempfile.TemporaryDirectory(prefix="codegene-loadtest-") as cwd:
+            os.chdir(cwd)
+            _user_turns(i, delay, args, corpus, mix, deadline, add)
+    else:
+        _user_turns(i, delay, args, corpus, mix, deadline, add)
+
+
+def _user_turns(i, delay, args, corpus, mix, deadline, add):
+    from streamlit.testing.v1 import AppTest
+
+    time.sleep(delay)
+    rng = random.Random(i)
+    t0 = time.monotonic()
+    try:
+        at = AppTest.from_file(os.path.join(apps.ROOT, f"{args.app}.py"), default_timeout=args.timeout)
+        at.run()
+        ok = not at.exception and not at.error
+    except Exception:
+        ok = False
+    add(f"{args.app}:open", time.monotonic() - t0, ok)
+    if not ok:
+        return
+    send = PAGES[args.app]
+    kinds, weights = zip(*mix.items())
+    while time.time() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        t0 = time.monotonic()
+        try:
+            if kind == "text":
+                before = len(_replies(at))
+                send(at, rng.choice(QUESTIONS))
+                ok = _turn_ok(at, before)
+            elif kind == "image":
+                _image_turn(corpus, rng)
+                ok = True
+            else:
+                _pdf_turn(corpus, rng)
+                ok = True
+        except Exception:
+            ok = False
+        add(f"{args.app}:{kind}", time.monotonic() - t0, ok)
+        time.sleep(rng.uniform(0, args.think_time * 2))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("text", "image", "pdf"):
+            raise argparse.ArgumentTypeError(f"unknown workload {kind!r}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", choices=sorted(PAGES), default="vaidic")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--ramp", choices=["constant", "linear", "step"], default="linear")
+    ap.add_argument("--ramp-time", type=float, default=10.0)
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds of load after the first user starts")
+    ap.add_argument("--mix", type=parse_mix, default=parse_mix("text=7,image=2,pdf=1"))
+    ap.add_argument("--think-time", type=float, default=2.0, help="mean seconds between a user's turns")
+    ap.add_argument("--timeout", type=float, default=120.0, help="per-turn page timeout")
+    ap.add_argument("--real", action="store_true", help="use real Ollama backends instead of the fake server")
+    ap.add_argument("--tps", type=float, default=30.0)
+    ap.add_argument("--first-token", type=float, default=0.5)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--corpus")
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    server = None
+    if not args.real:
+        server, url = fake_ollama.start(tokens_per_s=args.tps, first_token_delay=args.first_token,
+                                        error_rate=args.error_rate)
+        fake_ollama.use(url)
+    corpus = os.path.abspath(args.corpus or fixtures.build(os.path.join(tempfile.gettempdir(),
+                                                                        "codegene-bench-corpus")))
+
+    # "spawn": fresh interpreters that inherit OLLAMA_BACKENDS from os.environ
+    ctx = multiprocessing.get_context("spawn")
+    samples = ctx.Queue()
+    results = Results()
+    deadline = time.time() + args.duration
+    procs = []
+    for i in range(args.users):
+        delay = start_delay(i, args.users, args.ramp, args.ramp_time)
+        p = ctx.Process(target=user_loop, args=(i, delay, args, corpus, args.mix, deadline, samples), daemon=True)
+        p.start()
+        procs.append(p)
+    # A turn that started just before the deadline may run up to one timeout longer
+    hard_stop = deadline + args.timeout
+    while any(p.is_alive() for p in procs) and time.time() < hard_stop:
+        try:
+            results.add(*samples.get(timeout=0.5))
+        except queue.Empty:
+            pass
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+    while True:
+        try:
+            results.add(*samples.get(timeout=0.1))
+        except queue.Empty:
+            break
+    if server:
+        server.shutdown()
+
+    report = results.report()
+    print(f"{args.users} users, {args.ramp} ramp over {args.ramp_time:g}s, {args.duration:g}s")
+    print(f"{'scenario':<18}{'reqs':>7}{'err %':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for name, row in report.items():
+        print(f"{name:<18}{row['requests']:>7}{row['error_rate'] * 100:>8.1f}"
+              f"{row['p50']:>9.2f}{row['p95']:>9.2f}{row['p99']:>9.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
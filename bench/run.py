@@ -0,0 +1,195 @@
+# bench/run.py
+"""
+Offline benchmark suite: app helpers against a fixture corpus and a fake Ollama.
+
+    python -m bench.run                        # run everything, compare to bench/baseline.json
+    python -m bench.run -s ocr -s pdf_extract  # only some scenarios
+    python -m bench.run --save-baseline        # record the current numbers as the baseline
+
+A scenario regresses when its p50 or p95 is more than --tolerance above the
+baseline; the exit status is then 1 so CI can fail the build. Scenarios whose
+dependencies are missing on this machine are reported as skipped.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench import apps, fake_ollama, fixtures
+from bench.apps import Upload
+from conversation import Message
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples, wall):
+    return {
+        "n": len(samples),
+        "mean": statistics.fmean(samples),
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "ops_per_s": len(samples) / wall if wall else 0.0,
+    }
+
+
+# ------------------------------- #
+# SCENARIOS
+# Each returns a list of zero-argument calls; one call = one timed sample.
+# ------------------------------- #
+def scenario_pdf_extract(corpus):
+    app = apps.load("srinidhi")
+    return [lambda p=p: app.extract_from_pdf(Upload(p)) for p in fixtures.files(corpus, ".pdf")]
+
+
+def scenario_ocr(corpus):
+    app = apps.load("kamal")
+    return [lambda p=p: app.perform_ocr(Upload(p)) for p in fixtures.files(corpus, ".png", ".jpg", ".jpeg")]
+
+
+def scenario_ocr_clean(corpus):
+    app = apps.load("kamal")
+    text = fixtures.CODE_SAMPLE.replace("'", "’") * 50
+    return [lambda: app.looks_like_code(app.clean_ocr_code(text))]
+
+
+def scenario_process_csv(corpus):
+    app = apps.load("kamal")
+    return [lambda p=p: app.process_file(Upload(p)) for p in fixtures.files(corpus, ".csv")]
+
+
+def scenario_generate(corpus):
+    app = apps.load("vaidic")
+    history = [Message("user", "What is paging?"),
+               Message("assistant", fixtures.PROSE),
+               Message("user", "And segmentation?")]
+    ocr = [fixtures.CODE_SAMPLE * 4]
+    prompt = app.build_prompt(history, ocr)
+    # The request vaidic's send path streams through ollama_client.Generation
+    return [lambda: "".join(r.text for r in app.ollama_client.generate_stream(prompt, task="long"))]
+
+
+def scenario_model_stream(corpus):
+    app = apps.load("srinidhi")
+    messages = [{"role": "user", "content": "Explain deadlocks briefly."}]
+    return [lambda: "".join(chunk.text for chunk in app.model_stream(messages))]
+
+
+SCENARIOS = {
+    "pdf_extract": scenario_pdf_extract,
+    "ocr": scenario_ocr,
+    "ocr_clean": scenario_ocr_clean,
+    "process_csv": scenario_process_csv,
+    "generate": scenario_generate,
+    "model_stream": scenario_model_stream,
+}
+
+
+def run_scenario(calls, iterations, warmup):
+    for call in calls[:1] * warmup:
+        call()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for call in calls:
+            t0 = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - start)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base or "p50" not in res:
+            continue
+        for key in ("p50", "p95"):
+            if base[key] and res[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {res[key] * 1000:.1f}ms vs baseline {base[key] * 1000:.1f}ms")
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f"{'scenario':<14}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>9}{'Δp50':>9}")
+    for name, res in results.items():
+        if "skipped" in res:
+            print(f"{name:<14}  skipped: {res['skipped']}")
+            continue
+        base = baseline.get(name, {}).get("p50")
+        delta = f"{(res['p50'] / base - 1) * 100:+.0f}%" if base else "-"
+        print(f"{name:<14}{res['n']:>6}{res['p50'] * 1000:>10.1f}{res['p95'] * 1000:>10.1f}"
+              f"{res['p99'] * 1000:>10.1f}{res['ops_per_s']:>9.1f}{delta:>9}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS))
+    ap.add_argument("-n", "--iterations", type=int, default=5)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--corpus", help="directory of real uploads (default: generated fixtures)")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    ap.add_argument("--tps", type=float, default=200.0, help="fake server tokens per second")
+    ap.add_argument("--first-token", type=float, default=0.05, help="fake server first-token delay")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fake server injected error rate")
+    ap.add_argument("--json", help="also write results to this file")
+    args = ap.parse_args(argv)
+
+    # Time the real extraction work, not doc_cache hits
+    os.environ["DOC_CACHE"] = "0"
+    server, url = fake_ollama.start(tokens_per_s=args.tps, first_token_delay=args.first_token,
+                                    error_rate=args.error_rate, seed=1)
+    fake_ollama.use(url)
+    corpus = args.corpus or fixtures.build(os.path.join(tempfile.gettempdir(), "codegene-bench-corpus"))
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        try:
+            calls = SCENARIOS[name](corpus)
+            if not calls:
+                results[name] = {"skipped": "no matching files in corpus"}
+                continue
+            results[name] = run_scenario(calls, args.iterations, args.warmup)
+        except (ImportError, OSError, SyntaxError) as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+    server.shutdown()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        measured = {k: v for k, v in results.items() if "skipped" not in v}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **measured}, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print(f"REGRESSION {r}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
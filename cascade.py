@@ -0,0 +1,175 @@
+# cascade.py
+"""
+Small-model-first answers for short chat questions.
+
+The small model (the router's "draft" task, tinyllama by default) answers
+first, capped at DRAFT_TOKENS. The draft is kept when it looks trustworthy;
+otherwise the question is escalated to the large model (the first model that
+serves the task and is not the drafter, llama2 by default):
+
+    off      no draft; the router picks the model, as before
+    direct   keep the draft if it finished within the cap and does not hedge
+    verify   as direct, then the large model reads the draft and answers
+             YES/NO; a verdict costs a prefill and a token or two instead of
+             a full generation
+
+Questions that ask for code go straight to the large model; tasks other than
+"chat" are routed as before. Ollama's API has no token-level speculative decoding, so the
+draft is accepted or rejected as a whole.
+
+Modes are per app, from DEFAULT_MODES or the CASCADE environment variable:
+
+    CASCADE='{"srinidhi": "verify", "kamal": "off"}'
+
+    reply = cascade.chat("kamal", messages, task="chat")
+    for text in cascade.chat_stream("srinidhi", messages, task="chat"): ...
+
+Outcomes are counted per app and mode (stats(), the debug panel, and the
+cascade_answers_total counter) to track the acceptance rate.
+"""
+import json
+import os
+import re
+import threading
+
+import metrics
+import ollama_client
+from model_router import router
+
+MODES = ("off", "direct", "verify")
+DEFAULT_MODES = {"srinidhi": "direct", "kamal": "direct", "vaidic": "off", "mahesh": "off"}
+
+DRAFT_TASK = "draft"
+DRAFT_TOKENS = 256        # drafts that need more than this are not "short"
+MIN_DRAFT_CHARS = 2
+
+HEDGES = re.compile(
+    r"\b(i'?m not sure|i am not sure|i don'?t know|i do not know|i cannot|i can'?t|"
+    r"as an ai|not able to|unclear|it depends)\b",
+    re.IGNORECASE,
+)
+CODE_HINTS = re.compile(
+    r"```|\b(code|function|program|script|implement|debug|fix|class|regex|sql|algorithm)\b",
+    re.IGNORECASE,
+)
+VERIFY_PROMPT = (
+    "Is the previous assistant answer correct and complete for the user's question? "
+    "Reply with only YES or NO."
+)
+
+_lock = threading.Lock()
+_stats = {}   # (app, mode) -> {"drafted", "accepted", "escalated", "skipped"}
+
+
+def _load_modes():
+    modes = dict(DEFAULT_MODES)
+    raw = os.environ.get("CASCADE")
+    if raw:
+        try:
+            modes.update(json.loads(raw))
+        except ValueError:
+            pass
+    return modes
+
+
+_modes = _load_modes()
+
+
+def mode(app):
+    m = _modes.get(app, "off")
+    return m if m in MODES else "off"
+
+
+def _models(task):
+    """(drafter, verifier) model names, or None when there is only one model."""
+    drafts = router.models(DRAFT_TASK)
+    if not drafts:
+        return None
+    drafter = drafts[0]
+    for model in router.models(task):
+        if model != drafter:
+            return drafter, model
+    return None
+
+
+def _question(messages):
+    for m in reversed(messages):
+        if m["role"] == "user":
+            return m["content"]
+    return ""
+
+
+def _count(app, m, outcome):
+    with _lock:
+        row = _stats.setdefault((app, m), {"drafted": 0, "accepted": 0, "escalated": 0, "skipped": 0})
+        row[outcome] += 1
+        if outcome in ("accepted", "escalated"):
+            row["drafted"] += 1
+    metrics.count("cascade_answers_total", app=app, mode=m, outcome=outcome)
+
+
+def stats():
+    with _lock:
+        rows = [(app, m, dict(row)) for (app, m), row in sorted(_stats.items())]
+    out = []
+    for app, m, row in rows:
+        rate = row["accepted"] / row["drafted"] if row["drafted"] else None
+        out.append({"app": app, "mode": m, **row,
+                    "acceptance_rate": round(rate, 3) if rate is not None else None})
+    return out
+
+
+def _looks_final(draft):
+    text = draft.text.strip()
+    return (draft.done_reason != "length"
+            and len(text) >= MIN_DRAFT_CHARS
+            and not HEDGES.search(text))
+
+
+def _verified(messages, draft, verifier, fields):
+    check = messages + [
+        {"role": "assistant", "content": draft.text},
+        {"role": "user", "content": VERIFY_PROMPT},
+    ]
+    options = {**fields.get("options", {}), "num_predict": 3, "temperature": 0}
+    verdict = ollama_client.chat(check, task="chat", model=verifier, **{**fields, "options": options})
+    return verdict.text.strip().upper().startswith("YES")
+
+
+def _draft(app, messages, task, fields):
+    """(accepted draft Reply or None, verifier model or None)."""
+    m = mode(app)
+    if m == "off" or task != "chat":
+        return None, None
+    models = _models(task)
+    if models is None:
+        return None, None
+    drafter, verifier = models
+    if CODE_HINTS.search(_question(messages)):
+        _count(app, m, "skipped")
+        return None, verifier
+    options = {**fields.get("options", {}), "num_predict": DRAFT_TOKENS}
+    try:
+        draft = ollama_client.chat(messages, task=DRAFT_TASK, model=drafter, **{**fields, "options": options})
+        ok = _looks_final(draft) and (m != "verify" or _verified(messages, draft, verifier, fields))
+    except ollama_client.OllamaError:
+        ok = False
+    _count(app, m, "accepted" if ok else "escalated")
+    return (draft if ok else None), verifier
+
+
+def chat(app, messages, task="chat", **fields):
+    """Like ollama_client.chat, with the app's cascade mode applied."""
+    draft, verifier = _draft(app, messages, task, fields)
+    if draft is not None:
+        return draft
+    return ollama_client.chat(messages, task=task, model=verifier, **fields)
+
+
+def chat_stream(app, messages, task="chat", **fields):
+    """Like ollama_client.chat_stream; an accepted draft comes as one chunk."""
+    draft, verifier = _draft(app, messages, task, fields)
+    if draft is not None:
+        yield draft
+        return
+    yield from ollama_client.chat_stream(messages, task=task, model=verifier, **fields)
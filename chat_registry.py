@@ -0,0 +1,211 @@
+# chat_registry.py
+"""
+Saved chats for vaidic.py, updated incrementally.
+
+    registry = ChatRegistry(persist_dir=os.environ.get("VAIDIC_CHATS_DIR"),
+                            client=shared_store.client_id())
+    index = registry.save(index, messages, context, model)   # after every send
+    for i, chat in registry.search(query): ...                # sidebar
+    changed = registry.flush()                                # end of the run
+    registry.add(chat)                                        # an imported chat
+
+save() keeps an O(1) snapshot of the messages (see conversation.py), marks
+the chat changed only if messages were added, and computes the title once,
+when the chat gets its first message, so a send costs the same however long
+the chat is. Titles are kept lower-cased in a separate index and
+search results are memoized until the query or the set of chats changes, so
+reruns with the same search box contents do not rescan the chats.
+
+Chats changed since the last flush() are tracked by list position. flush()
+returns those positions (for shared_store.sync_chats) and, with a persist_dir,
+hands the changed chats to a background thread that writes one JSON file per
+chat; the registry is loaded back from that directory on session start.
+With a client, the files go in (and are loaded from) the client's own
+subdirectory of persist_dir, so browsers sharing one VAIDIC_CHATS_DIR never see
+each other's chats. The client id only survives a new session when serve.py's
+proxy sets its cookie; served directly, each session starts a fresh
+subdirectory.
+"""
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+
+from conversation import Conversation, json_default
+
+TITLE_CHARS = 30
+
+_writes = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def title_for(messages):
+    return messages[0].content[:TITLE_CHARS] + "..." if messages else "Untitled Chat"
+
+
+class ChatRegistry:
+    def __init__(self, chats=(), persist_dir=None, client=None):
+        if persist_dir and client:
+            # The id comes from a cookie; never let it name another directory
+            persist_dir = os.path.join(persist_dir, os.path.basename(client) or "_")
+        self.persist_dir = persist_dir
+        self._chats = []
+        self._titles = []           # lower-cased, same order as _chats
+        self._ids = set()
+        self._dirty = set()
+        self._search = (None, None)
+        if persist_dir:
+            # With the shared store as well, both hold the same chats; the
+            # store's copy comes first and the directory's is skipped
+            chats = list(chats) + _load_dir(persist_dir)
+        for chat in chats:
+            self._add(chat)
+
+    def __len__(self):
+        return len(self._chats)
+
+    def __getitem__(self, index):
+        return self._chats[index]
+
+    def __iter__(self):
+        return iter(self._chats)
+
+    def _add(self, chat):
+        """Append `chat`; returns its index, or None if its id is already here."""
+        if not chat.get("id"):
+            chat["id"] = uuid.uuid4().hex
+        elif chat["id"] in self._ids:
+            return None
+        chat.setdefault("created", time.time())
+        if not isinstance(chat.get("messages"), Conversation):
+            chat["messages"] = Conversation.from_json(chat.get("messages"))
+        self._ids.add(chat["id"])
+        self._chats.append(chat)
+        self._titles.append(chat["title"].lower())
+        self._search = (None, None)
+        return len(self._chats) - 1
+
+    def add(self, chat):
+        """Add a chat made elsewhere (an imported archive); returns its index.
+
+        A chat whose id is already here is not added again (None).
+        """
+        index = self._add(dict(chat))
+        if index is not None:
+            self._dirty.add(index)
+        return index
+
+    def save(self, index, messages, context=None, model=None):
+        """Save `messages` as chat `index` (a new chat if None); returns the index."""
+        if index is None:
+            self._dirty.add(self._add({
+                "title": title_for(messages),
+                "messages": messages.snapshot(),
+                "context": context,
+                "model": model,
+            }))
+            return len(self._chats) - 1
+
+        chat = self._chats[index]
+        stored = chat["messages"]
+        n = len(stored)
+        # Usually `messages` continues the stored chat: the snapshot then
+        # shares its list, so nothing is copied however long the chat is
+        continues = n <= len(messages) and (n == 0 or messages[n - 1] is stored[-1])
+        changed = not continues or len(messages) > n
+        if changed:
+            chat["messages"] = messages.snapshot()
+        if not n and messages:
+            chat["title"] = title_for(messages)
+            self._titles[index] = chat["title"].lower()
+            self._search = (None, None)
+        if context != chat.get("context") or model != chat.get("model"):
+            chat["context"] = context
+            chat["model"] = model
+            changed = True
+        if changed:
+            self._dirty.add(index)
+        return index
+
+    def search(self, query):
+        """[(index, chat)] whose title contains `query` (case-insensitive)."""
+        query = query.lower()
+        last_query, hits = self._search
+        if last_query != query:
+            hits = [i for i, title in enumerate(self._titles) if query in title]
+            self._search = (query, hits)
+        return [(i, self._chats[i]) for i in hits]
+
+    def as_dict(self):
+        """{str(index): chat}, the shape shared_store.sync_chats expects."""
+        return {str(i): chat for i, chat in enumerate(self._chats)}
+
+    def flush(self):
+        """Positions of the chats changed since the last flush.
+
+        With a persist_dir they are also queued for the background writer;
+        the message lists are snapshots, so later sends do not race the write.
+        """
+        dirty, self._dirty = self._dirty, set()
+        if self.persist_dir:
+            for i in dirty:
+                chat = dict(self._chats[i], messages=self._chats[i]["messages"].snapshot())
+                _submit(self.persist_dir, chat)
+        return dirty
+
+
+# ------------------------------- #
+# DISK PERSISTENCE
+# ------------------------------- #
+def _load_dir(path):
+    chats = []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return chats
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(path, name), encoding="utf-8") as f:
+                chats.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    chats.sort(key=lambda c: c.get("created", 0))
+    return chats
+
+
+def _submit(path, chat):
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="chat-writer", daemon=True)
+            _writer.start()
+    _writes.put((path, chat))
+
+
+def _write_loop():
+    while True:
+        path, chat = _writes.get()
+        try:
+            _write(path, chat)
+        except OSError:
+            pass    # best effort: the chat is still in the session
+        finally:
+            _writes.task_done()
+
+
+def _write(path, chat):
+    os.makedirs(path, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(chat, f, ensure_ascii=False, default=json_default)
+        os.replace(tmp, os.path.join(path, f"{chat['id']}.json"))
+    except BaseException:
+        os.remove(tmp)
+        raise
@@ -0,0 +1,111 @@
+# conversation.py
+"""
+Compact chat history shared by the app scripts.
+
+Every session keeps its chats in st.session_state, so with hundreds of
+sessions per worker the per-message overhead matters:
+
+- Message uses __slots__ (no per-instance dict) and interns its role, so
+  the role strings are shared by every message in the process.
+- Conversation is append-only. snapshot() returns a view that shares the
+  underlying list instead of copying it; a copy is made only if a shared
+  message is replaced (replace_last) or a snapshot is appended to after the
+  original has grown. Messages appended after the last snapshot are private,
+  so replacing them (the "thinking..." placeholder) never copies.
+
+Messages are never modified after creation, so views can share them safely.
+to_json()/from_json() convert to plain lists of dicts (shared_store, files);
+json_default lets json.dump write chats that hold Conversations directly.
+"""
+import sys
+
+
+def json_default(obj):
+    """json.dump(default=...) for Conversation and anything else with a to_json()."""
+    return obj.to_json()
+
+
+class Message:
+    __slots__ = ("role", "content", "time", "image")
+
+    def __init__(self, role, content, time=None, image=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.time = time       # display time ("14:05"), if the app shows one
+        self.image = image     # base64 PNG thumbnail shown with the message
+
+    def to_dict(self):
+        d = {"role": self.role, "content": self.content}
+        if self.time is not None:
+            d["time"] = self.time
+        if self.image is not None:
+            d["image"] = self.image
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["role"], d["content"], d.get("time"), d.get("image"))
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r})"
+
+
+class Conversation:
+    __slots__ = ("_items", "_len", "_frozen")
+
+    def __init__(self, messages=(), _items=None, _len=None):
+        if _items is None:
+            _items = list(messages)
+        self._items = _items
+        self._len = len(_items) if _len is None else _len
+        self._frozen = self._len if _len is not None else 0   # leading items others can see
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        items = self._items
+        return (items[i] for i in range(self._len))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._items[:self._len][i]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        return self._items[i]
+
+    def _own(self):
+        self._items = self._items[:self._len]
+        self._frozen = 0
+
+    def append(self, message):
+        if self._len != len(self._items):
+            # Someone sharing the list has appended past this view
+            self._own()
+        self._items.append(message)
+        self._len += 1
+
+    def add(self, role, content, **fields):
+        self.append(Message(role, content, **fields))
+
+    def replace_last(self, message):
+        if self._len <= self._frozen or self._len != len(self._items):
+            self._own()
+        self._items[-1] = message
+
+    def snapshot(self):
+        """O(1) copy: shares storage with this conversation until either changes."""
+        self._frozen = self._len
+        return Conversation(_items=self._items, _len=self._len)
+
+    def to_json(self):
+        return [m.to_dict() for m in self]
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(Message.from_dict(d) for d in data or ())
@@ -0,0 +1,185 @@
+# doc_cache.py
+"""
+Deployment-wide cache of derived document artifacts, keyed by content hash.
+
+When a class uploads the same assignment PDF, only the first upload pays for
+extraction, OCR and summarizing; every other session, in any Streamlit worker
+process on the machine, reads the result from disk.
+
+    text = doc_cache.get_or_compute(upload.digest(), "pdf_text", extract)
+    doc_cache.get(doc_cache.key(template_id, model, query), "research-plan")
+
+Artifacts are JSON files under DOC_CACHE_DIR (default: <tmp>/codegene-doc-cache),
+one per (document hash, kind). Writes are atomic (temp file + rename) and a
+per-artifact lock file makes concurrent uploads of the same document wait for
+the first computation instead of repeating it. The directory is kept under
+DOC_CACHE_MAX_MB (default 512) by evicting the least recently used artifacts.
+DOC_CACHE=0 turns the cache off (the offline benchmarks do, to time the work).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("DOC_CACHE", "1") != "0"
+CACHE_DIR = os.environ.get("DOC_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "codegene-doc-cache")
+MAX_BYTES = int(float(os.environ.get("DOC_CACHE_MAX_MB", "512")) * 1024 * 1024)
+EVICT_TO = 0.9            # evict down to this share of MAX_BYTES
+EVICT_INTERVAL = 30.0     # seconds between size checks in one process
+
+CHUNK_CHARS = 1500
+CHUNK_OVERLAP = 200
+
+_last_evict = 0.0
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        # LK_LOCK retries for ~10 s before raising; keep waiting like flock does
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked(path):
+    with open(path, "a+b") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def key(*parts):
+    """A digest for artifacts derived from JSON-serializable `parts` rather than a document."""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _path(digest, kind):
+    return os.path.join(CACHE_DIR, digest[:2], f"{digest}.{kind}.json")
+
+
+def get(digest, kind):
+    """Cached artifact or None. A hit refreshes the artifact's LRU position."""
+    path = _path(digest, kind)
+    try:
+        with open(path, encoding="utf-8") as f:
+            value = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def put(digest, kind, value):
+    path = _path(digest, kind)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    _maybe_evict()
+
+
+def get_or_compute(digest, kind, compute):
+    """Cached artifact, or compute() it once across all processes and store it."""
+    if not ENABLED:
+        return compute()
+    value = get(digest, kind)
+    if value is not None:
+        return value
+    path = _path(digest, kind)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _locked(path[:-len(".json")] + ".lock"):
+        value = get(digest, kind)    # another process may have finished meanwhile
+        if value is None:
+            value = compute()
+            put(digest, kind, value)
+    return value
+
+
+def chunk_text(text, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Overlapping chunks as [start offset, text] pairs (JSON-friendly)."""
+    step = size - overlap
+    return [[i, text[i:i + size]] for i in range(0, max(len(text) - overlap, 1), step)]
+
+
+def _maybe_evict():
+    global _last_evict
+    now = time.monotonic()
+    if now - _last_evict < EVICT_INTERVAL:
+        return
+    _last_evict = now
+    evict()
+
+
+def evict(max_bytes=None):
+    """Delete least recently used artifacts until the cache fits."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    total = 0
+    # Other processes evict and write concurrently: anything that vanishes
+    # between listing and stat() is skipped, never raised to the caller
+    try:
+        subs = [sub.path for sub in os.scandir(CACHE_DIR) if sub.is_dir()]
+    except OSError:
+        return 0
+    for sub in subs:
+        try:
+            entries = [e for e in os.scandir(sub) if e.name.endswith(".json")]
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes * EVICT_TO:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        # The lock file goes too; at worst a process still waiting on it
+        # computes the artifact once more.
+        try:
+            os.remove(path[:-len(".json")] + ".lock")
+        except OSError:
+            pass
+        total -= size
+        removed += 1
+    return removed
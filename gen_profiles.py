@@ -0,0 +1,172 @@
+# gen_profiles.py
+"""
+Generation limits per task, sent as Ollama options with every request.
+
+    gen_profiles.options("summarize", question, model="llama2")
+    # {"num_predict": 512, "temperature": 0.3, "num_ctx": 4096, "stop": [...]}
+
+ollama_client applies them to every call; options a caller passes itself
+(cascade's draft cap, for one) win key by key. A profile sets:
+
+    max_tokens   hard cap on num_predict
+    min_tokens   the adaptive budget never goes below this
+    stop         stop sequences (the "User:" turn vaidic's prompts end with)
+    temperature  sampling temperature
+
+num_ctx is set per model, not per task: Ollama reloads a model whenever the
+requested context length changes, so one model always gets the same value.
+
+The num_predict budget adapts to:
+
+- the question: "briefly", "in one line", yes/no questions halve it, "in
+  detail" / "step by step" raise it (never past max_tokens);
+- observed answers: once a task has MIN_SAMPLES finished answers, the budget
+  is HEADROOM times their 90th-percentile length. Answers cut off by the
+  budget count double, so a budget that is too small grows back. Calls
+  that set num_predict themselves (research plans, cascade verdicts) are
+  not counted.
+
+Profiles can be overridden with GEN_PROFILES, a JSON object like
+OLLAMA_BACKENDS: GEN_PROFILES='{"research": {"max_tokens": 2048}}'.
+"""
+import json
+import os
+import re
+import threading
+from collections import deque
+
+WINDOW = 50          # recent answer lengths kept per task
+MIN_SAMPLES = 5
+HEADROOM = 1.5
+BRIEF_FACTOR = 0.5
+DETAILED_FACTOR = 1.5
+
+TURN_STOPS = ["\nUser:", "\nUSER:"]
+
+PROFILES = {
+    "chat":      {"max_tokens": 512,  "min_tokens": 128, "temperature": 0.7, "stop": TURN_STOPS},
+    "draft":     {"max_tokens": 256,  "min_tokens": 64,  "temperature": 0.3, "stop": TURN_STOPS},
+    "long":      {"max_tokens": 1024, "min_tokens": 256, "temperature": 0.7, "stop": TURN_STOPS},
+    "code":      {"max_tokens": 1536, "min_tokens": 384, "temperature": 0.2, "stop": []},
+    "summarize": {"max_tokens": 512,  "min_tokens": 128, "temperature": 0.3, "stop": []},
+    "research":  {"max_tokens": 1536, "min_tokens": 512, "temperature": 0.5, "stop": []},
+}
+
+# Context length per model; models not listed keep the server default
+MODEL_CTX = {"llama2": 4096, "tinyllama": 2048}
+
+BRIEF = re.compile(
+    r"\b(briefly|in brief|in short|short answer|one (line|sentence|word)|tl;?dr|yes or no|quick(ly)?)\b",
+    re.IGNORECASE,
+)
+DETAILED = re.compile(
+    r"\b(in detail|detailed|step[- ]by[- ]step|elaborate|comprehensive|thorough|in depth|essay)\b",
+    re.IGNORECASE,
+)
+YES_NO = re.compile(r"^\s*(is|are|was|were|do|does|did|can|could|should|will|would|has|have)\b[^.\n]{0,120}\?\s*$",
+                    re.IGNORECASE)
+
+
+class Profile:
+    __slots__ = ("task", "max_tokens", "min_tokens", "temperature", "stop", "_lengths", "_cut")
+
+    def __init__(self, task, max_tokens, min_tokens, temperature=None, stop=()):
+        self.task = task
+        self.max_tokens = max_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self.temperature = temperature
+        self.stop = list(stop)
+        self._lengths = deque(maxlen=WINDOW)
+        self._cut = 0
+
+    def observed(self):
+        """90th-percentile answer length, or None until MIN_SAMPLES answers."""
+        if len(self._lengths) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self._lengths)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def budget(self, question=""):
+        p90 = self.observed()
+        base = self.max_tokens if p90 is None else p90 * HEADROOM
+        kind = question_kind(question)
+        if kind == "brief":
+            base *= BRIEF_FACTOR
+        elif kind == "detailed":
+            base = max(base * DETAILED_FACTOR, self.max_tokens * 0.75)
+        return int(min(self.max_tokens, max(self.min_tokens, base)))
+
+    def observe(self, reply):
+        if not reply.eval_count:
+            return
+        cut = reply.done_reason == "length"
+        with _lock:
+            self._lengths.append(reply.eval_count * (2 if cut else 1))
+            self._cut += cut
+
+    def stats(self):
+        return {
+            "task": self.task,
+            "budget": self.budget(),
+            "max_tokens": self.max_tokens,
+            "p90_tokens": self.observed(),
+            "samples": len(self._lengths),
+            "cut_off": self._cut,
+        }
+
+
+_lock = threading.Lock()
+
+
+def question_kind(text):
+    """"brief", "detailed" or "normal", judged from the end of the prompt."""
+    tail = (text or "")[-400:]
+    if BRIEF.search(tail):
+        return "brief"
+    if DETAILED.search(tail):
+        return "detailed"
+    last = tail.strip().splitlines()[-1] if tail.strip() else ""
+    if YES_NO.match(last):
+        return "brief"
+    return "normal"
+
+
+def _load_profiles():
+    config = {task: dict(p) for task, p in PROFILES.items()}
+    raw = os.environ.get("GEN_PROFILES")
+    if raw:
+        try:
+            for task, values in json.loads(raw).items():
+                config.setdefault(task, dict(PROFILES["chat"])).update(values)
+        except (ValueError, AttributeError):
+            pass
+    return {task: Profile(task, **p) for task, p in config.items()}
+
+
+# One set per process, so observed lengths are shared by every session
+_profiles = _load_profiles()
+
+
+def profile(task):
+    return _profiles.get(task) or _profiles["chat"]
+
+
+def options(task, question="", model=None):
+    p = profile(task)
+    opts = {"num_predict": p.budget(question)}
+    if p.temperature is not None:
+        opts["temperature"] = p.temperature
+    if p.stop:
+        opts["stop"] = list(p.stop)
+    ctx = MODEL_CTX.get((model or "").split(":")[0])
+    if ctx:
+        opts["num_ctx"] = ctx
+    return opts
+
+
+def observe(task, reply):
+    profile(task).observe(reply)
+
+
+def stats():
+    return [p.stats() for p in _profiles.values()]
@@ -0,0 +1,271 @@
+# imagegen.py
+"""
+Local, CPU-only image generation for kamal.py's Image Generator page.
+
+    job = imagegen.submit(prompt, seed=42, steps=2)
+    job.status, job.position, job.progress, job.png, job.error, job.done, job.stop()
+
+Jobs run one at a time on a single worker thread per process: a diffusion step
+already uses every core, so running two images side by side only makes both
+slower. Jobs wait in a FIFO queue and report their position in it, then the
+fraction of denoising steps done. Like research.Research, the page polls the
+job from its reruns.
+
+Images are cached in doc_cache (kind "image-png") by backend, model, prompt,
+seed, steps and size, so asking for the same picture again costs nothing, in
+any session. A job for an image that is already queued or running joins that
+job instead of queueing a second one.
+
+Backends, chosen with IMAGEGEN_BACKEND:
+
+    diffusers  (default) a small distilled text-to-image model through
+               diffusers + torch on the CPU, float32. IMAGEGEN_MODEL is a
+               Hugging Face id or local path (default stabilityai/sd-turbo,
+               which needs 1-4 steps and no classifier-free guidance);
+               IMAGEGEN_GUIDANCE sets the guidance scale for models that
+               want it, IMAGEGEN_THREADS the torch thread count.
+    stub       a deterministic gradient PNG derived from prompt and seed, with
+               simulated steps; no dependencies, for tests and the benchmarks.
+"""
+import base64
+import io
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+import doc_cache
+import metrics
+from ollama_client import CancelToken, Cancelled
+from runtime import lazy_import
+
+BACKEND = os.environ.get("IMAGEGEN_BACKEND", "diffusers")
+MODEL = os.environ.get("IMAGEGEN_MODEL", "stabilityai/sd-turbo")
+GUIDANCE = float(os.environ.get("IMAGEGEN_GUIDANCE", "0.0"))
+THREADS = int(os.environ.get("IMAGEGEN_THREADS", "0"))    # 0: torch's default
+
+DEFAULT_STEPS = 2
+MAX_STEPS = 8
+DEFAULT_SIZE = 512
+STUB_STEP_SECONDS = 0.05
+
+
+# ------------------------------- #
+# BACKENDS
+# ------------------------------- #
+class DiffusersBackend:
+    name = "diffusers"
+
+    def __init__(self, model=MODEL):
+        torch = lazy_import("torch")
+        diffusers = lazy_import("diffusers")
+        if THREADS:
+            torch.set_num_threads(THREADS)
+        self.model = model
+        self._torch = torch
+        with metrics.stage("imagegen_load", model=model):
+            self._pipe = diffusers.AutoPipelineForText2Image.from_pretrained(model, torch_dtype=torch.float32)
+        self._pipe.to("cpu")
+        self._pipe.set_progress_bar_config(disable=True)
+        self._pipe.enable_attention_slicing()    # lower peak memory, same image
+
+    def generate(self, prompt, seed, steps, size, progress, token):
+        """PNG bytes; progress(fraction) after every step, token checked between steps."""
+        def on_step(pipe, step, timestep, kwargs):
+            progress((step + 1) / steps)
+            token.check()
+            return kwargs
+
+        with self._torch.inference_mode():
+            image = self._pipe(
+                prompt,
+                num_inference_steps=steps,
+                guidance_scale=GUIDANCE,
+                width=size,
+                height=size,
+                generator=self._torch.Generator("cpu").manual_seed(seed),
+                callback_on_step_end=on_step,
+            ).images[0]
+        buf = io.BytesIO()
+        image.save(buf, format="PNG")
+        return buf.getvalue()
+
+
+class StubBackend:
+    name = "stub"
+    model = "gradient"
+
+    def generate(self, prompt, seed, steps, size, progress, token):
+        for step in range(steps):
+            time.sleep(STUB_STEP_SECONDS)
+            progress((step + 1) / steps)
+            token.check()
+        return _gradient_png(doc_cache.key(prompt, seed), size)
+
+
+def _gradient_png(digest, size):
+    """A size x size RGB PNG blending two colours taken from `digest`."""
+    a, b = bytes.fromhex(digest[:6]), bytes.fromhex(digest[6:12])
+    span = max(1, 2 * (size - 1))
+    rows = []
+    for y in range(size):
+        row = bytearray(b"\x00")    # filter type 0 (none)
+        for x in range(size):
+            t = (x + y) / span
+            row += bytes(int(a[c] + (b[c] - a[c]) * t) for c in range(3))
+        rows.append(bytes(row))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows))) + chunk(b"IEND", b""))
+
+
+BACKENDS = {"diffusers": DiffusersBackend, "stub": StubBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    """The backend for this process, created (and its model loaded) on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND not in BACKENDS:
+                raise RuntimeError(f"Unknown image backend {BACKEND!r} (IMAGEGEN_BACKEND)")
+            try:
+                _backend = BACKENDS[BACKEND]()
+            except ImportError as e:
+                raise RuntimeError(
+                    f"Image backend {BACKEND!r} needs diffusers and torch ({e}); "
+                    "install them or set IMAGEGEN_BACKEND=stub"
+                ) from e
+        return _backend
+
+
+# ------------------------------- #
+# JOBS
+# ------------------------------- #
+class Job:
+    def __init__(self, prompt, seed, steps, size):
+        self.prompt = prompt
+        self.seed = seed
+        self.steps = steps
+        self.size = size
+        self.status = "queued"     # queued, loading, running, done, failed, stopped
+        self.progress = 0.0
+        self.png = None
+        self.cached = False
+        self.error = None
+        self.done = False
+        self.token = CancelToken()
+        self.submitted = time.monotonic()
+        self.key = doc_cache.key(BACKEND, MODEL if BACKEND == "diffusers" else None, prompt, seed, steps, size)
+        self._users = 1            # sessions waiting on this job
+
+    @property
+    def position(self):
+        """1-based place in the queue, or None once the job has left it."""
+        with _cond:
+            try:
+                return _queue.index(self) + 1
+            except ValueError:
+                return None
+
+    def stop(self):
+        """Give up on the image; it is only cancelled once no session wants it."""
+        with _cond:
+            self._users -= 1
+            if self._users > 0 or self.done:
+                return
+            if _active.get(self.key) is self:
+                del _active[self.key]     # a new request for the image starts afresh
+            if self in _queue:
+                _queue.remove(self)
+                self._finish("stopped")
+                return
+        self.token.cancel()
+
+    def _finish(self, status, png=None, error=None):
+        self.png = png
+        self.error = error
+        self.status = status
+        self.done = True
+        metrics.count("imagegen_jobs_total", backend=BACKEND, outcome=status)
+
+
+_queue = deque()
+_active = {}                  # cache key -> queued or running Job
+_cond = threading.Condition()
+_worker = None
+
+
+def submit(prompt, seed=0, steps=DEFAULT_STEPS, size=DEFAULT_SIZE):
+    """Queue an image (or join the identical one already queued); returns its Job."""
+    global _worker
+    job = Job(prompt, int(seed), max(1, min(MAX_STEPS, int(steps))), int(size))
+    key = job.key
+    if doc_cache.ENABLED:
+        cached = doc_cache.get(key, "image-png")
+        if cached is not None:
+            job.progress = 1.0
+            job.cached = True
+            job._finish("done", png=base64.b64decode(cached))
+            return job
+    with _cond:
+        if key in _active:
+            _active[key]._users += 1
+            return _active[key]
+        _active[key] = job
+        _queue.append(job)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work_loop, name="imagegen", daemon=True)
+            _worker.start()
+        _cond.notify()
+    return job
+
+
+def pending():
+    """Number of jobs waiting in the queue (not counting the running one)."""
+    with _cond:
+        return len(_queue)
+
+
+def _work_loop():
+    while True:
+        with _cond:
+            while not _queue:
+                _cond.wait()
+            job = _queue.popleft()
+        try:
+            _run(job)
+        finally:
+            with _cond:
+                if _active.get(job.key) is job:
+                    del _active[job.key]
+
+
+def _run(job):
+    def progress(fraction):
+        job.progress = fraction
+
+    metrics.count("imagegen_queue_wait_seconds_sum", time.monotonic() - job.submitted, backend=BACKEND)
+    metrics.count("imagegen_queue_wait_count", backend=BACKEND)
+    try:
+        job.status = "loading"
+        engine = backend()
+        job.status = "running"
+        with metrics.stage("imagegen", backend=engine.name):
+            png = engine.generate(job.prompt, job.seed, job.steps, job.size, progress, job.token)
+        if doc_cache.ENABLED:
+            doc_cache.put(job.key, "image-png", base64.b64encode(png).decode("ascii"))
+        job._finish("done", png=png)
+    except Cancelled:
+        job._finish("stopped")
+    except Exception as e:
+        job._finish("failed", error=str(e))
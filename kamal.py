@@ -1,32 +1,46 @@
 # app.py
 import streamlit as st
-import uuid
-import speech_recognition as sr
-import ollama
-import PyPDF2
-import pandas as pd
-from PIL import Image
-import pytesseract
-import io
 import base64
-import re
+import uuid
 import time
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+import archive
+import cascade
+import doc_cache
+import imagegen
+import metrics
+import ocr
+import ollama_client
+import prompts
+import research
+import shared_store
+import speech
+import textnorm
+import uploads
+from conversation import Conversation
+from model_router import router, classify
+from runtime import lazy_import, read_text, tesseract
+
+# Heavy modules (pandas, PyPDF2, PIL, pytesseract, speech_recognition) are
+# imported on first use through lazy_import, not on every cold start.
 
 # ------------------------------- #
 # CONFIG & SETUP
 # ------------------------------- #
 st.set_page_config(page_title="CodeGene", layout="wide")
 
-# Path to tesseract - adjust if needed
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# Path to tesseract: set TESSERACT_CMD if it is not on PATH (see runtime.tesseract)
+OCR_CONFIG = r'--oem 3 --psm 6 -c preserve_interword_spaces=1'
+OCR_ALT_CONFIG = r'--oem 3 --psm 11'
+OCR_CACHE_KIND = "ocr-layout-v1"  # bump when the OCR configs or post-processing change
+CHAT_THUMB_WIDTH = 400            # shown at max 200px; 2x for high-DPI screens
 
 # ------------------------------- #
 # HELPER: LOAD CSS
 # ------------------------------- #
 def load_css(file_name: str = "styles.css"):
-        with open(file_name) as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        # read_text caches the file for the process; only the injection runs per rerun
+        st.markdown(f"<style>{read_text(file_name)}</style>", unsafe_allow_html=True)
 
 load_css("styles.css")
 
@@ -35,31 +49,32 @@ load_css("styles.css")
 # ------------------------------- #
 def new_chat():
     chat_id = str(uuid.uuid4())
-    st.session_state.chats[chat_id] = {"title": "New Chat", "messages": []}
+    st.session_state.chats[chat_id] = {"title": "New Chat", "messages": Conversation()}
     st.session_state.current_chat = chat_id
 
+def archived_chats():
+    return (dict(chat, id=chat_id) for chat_id, chat in st.session_state.chats.items())
+
+def import_chat(chat):
+    chat_id = chat.get("id") or str(uuid.uuid4())
+    if chat_id in st.session_state.chats:
+        return      # already here (archive imported twice)
+    st.session_state.chats[chat_id] = {
+        "title": archive.title_of(chat),
+        "messages": Conversation.from_json(chat.get("messages")),
+    }
+
+def upload_key(uploaded_file):
+    """Identifies one upload, so reruns (polls included) handle it only once."""
+    return getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+
 def looks_like_code(text: str) -> bool:
     """Detect if text looks like programming code."""
-    code_keywords = [
-        "def ", "class ", "import ", "return ", "if ", "for ", "while ",
-        "print(", "=", ":", "(", ")", "{", "}", ";"
-    ]
-    return sum(k in text for k in code_keywords) >= 3
+    return textnorm.looks_like_code(text)
 
 def clean_ocr_code(text: str) -> str:
     """Normalize OCR output to cleaner code format."""
-    replacements = {
-        "“": '"', "”": '"', "‘": "'", "’": "'", "—": "-",
-        "•": "-", "´": "'"
-    }
-    for k, v in replacements.items():
-        text = text.replace(k, v)
-
-    # normalize whitespace/indentation
-    text = re.sub(r'^[ \t]+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s+\n', '\n', text)
-    text = re.sub(r'[^\x09\x0A\x0D\x20-\x7E]', '', text)
-    return text.strip()
+    return textnorm.clean_code(text, keep_indent=True)
 
 def process_file(uploaded_file):
     """Process non-image files immediately (text/pdf/csv)."""
@@ -68,27 +83,35 @@ def process_file(uploaded_file):
             return uploaded_file.read().decode("utf-8")
         
         elif uploaded_file.type == "application/pdf":
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            pdf_text = "\n".join([page.extract_text() or "" for page in pdf_reader.pages])
-            
+            # Text, chunks and summary are shared by every session that uploads
+            # the same PDF (see doc_cache)
+            upload = uploads.wrap(uploaded_file)
+            key = upload.digest()
+
+            def extract():
+                with metrics.stage("pdf_extract", file=upload.name):
+                    pdf_reader = lazy_import("PyPDF2").PdfReader(upload.path)
+                    return "\n".join([page.extract_text() or "" for page in pdf_reader.pages])
+
+            pdf_text = doc_cache.get_or_compute(key, "pdf_text", extract)
+            doc_cache.get_or_compute(key, "pdf_chunks", lambda: doc_cache.chunk_text(pdf_text))
+            # Deep Research can ground its answers in this session's PDFs
+            if all(d["digest"] != key for d in st.session_state.documents):
+                st.session_state.documents.append({"name": upload.name, "digest": key})
+
             # ✨ Summarize PDF intelligently
+            template = prompts.get("pdf_summary")
             with st.spinner("🤖 Summarizing PDF content..."):
-                summary = call_ollama_once(
-                    system_prompt="You are CodeGene AI, an expert document summarizer.",
-                    user_prompt=f"Summarize the following PDF in concise bullet points:\n\n{pdf_text}",
-                    model_name="llama2:latest"
-                )
+                summary = doc_cache.get_or_compute(key, f"summary-{template.id}", lambda: call_ollama_once(
+                    system_prompt=prompts.get("pdf_system").render(),
+                    user_prompt=template.render(pdf_text=pdf_text),
+                    task="summarize"
+                ))
 
                 # Return BOTH user upload message + assistant summary properly
                 current_chat = st.session_state.chats[st.session_state.current_chat]
-                current_chat["messages"].append({
-                    "role": "user",
-                    "content": f"📄 Uploaded file: {uploaded_file.name}"
-                })
-                current_chat["messages"].append({
-                    "role": "assistant",
-                    "content": f"**Summary of {uploaded_file.name}:**\n\n{summary}"
-                })
+                current_chat["messages"].add("user", f"📄 Uploaded file: {uploaded_file.name}")
+                current_chat["messages"].add("assistant", f"**Summary of {uploaded_file.name}:**\n\n{summary}")
 
                 if current_chat["title"] == "New Chat":
                     current_chat["title"] = f"PDF: {uploaded_file.name}"
@@ -96,97 +119,124 @@ def process_file(uploaded_file):
             return None  # Prevent double message
 
         elif uploaded_file.type == "text/csv":
-            df = pd.read_csv(uploaded_file)
-            return df.to_string()
+            with metrics.stage("csv_parse", file=uploaded_file.name):
+                df = lazy_import("pandas").read_csv(uploaded_file)
+                return df.to_string()
     except Exception as e:
         return f"File processing error: {e}"
     return "Unsupported file type"
 
 def perform_ocr(image_file):
-    """Extract text from an uploaded image file using pytesseract."""
+    """Extract text from an uploaded image file using pytesseract.
+
+    Cached across sessions and worker processes by image hash (doc_cache)."""
     try:
-        image_file.seek(0)
-        image = Image.open(image_file).convert("RGB")
-        custom_config = r'--oem 3 --psm 6 -c preserve_interword_spaces=1'
-        text = pytesseract.image_to_string(image, config=custom_config)
+        upload = uploads.wrap(image_file)
+        return doc_cache.get_or_compute(upload.digest(), OCR_CACHE_KIND, lambda: _ocr_image(upload))
+    except Exception as e:
+        return f"OCR failed: {e}"
+
+def _ocr_image(upload):
+    with metrics.stage("ocr", file=upload.name):
+        pytesseract = tesseract()
+        image = upload.image()
+        # Large scans are split into bands and OCR'd on all cores; the
+        # layout pass keeps code indentation
+        text = ocr.read(image, config=OCR_CONFIG, layout=True)
         # Quick cleanup of common OCR substitutions
-        text = text.replace("‘", "'").replace("’", "'").replace("“", '"').replace("”", '"')
-        text = text.replace("•", "-").replace("\t", "    ")
-        
+        text = textnorm.normalize_ocr(text)
+
         # If result seems very short, try alternative psm
         if len(text.strip()) < 10:
-            alt_config = r'--oem 3 --psm 11'
-            alt_text = pytesseract.image_to_string(image, config=alt_config)
-            alt_text = alt_text.replace("‘", "'").replace("’", "'").replace("“", '"').replace("”", '"')
+            alt_text = pytesseract.image_to_string(image, config=OCR_ALT_CONFIG)
+            alt_text = textnorm.normalize_ocr(alt_text)
             if len(alt_text.strip()) > len(text.strip()):
                 text = alt_text
 
-        return text.strip()
-    except Exception as e:
-        return f"OCR failed: {e}"
+    # rstrip only: the first line's indentation is relative to the others
+    return text.rstrip()
 
 def image_to_base64(image_file):
-    image_file.seek(0)
-    image = Image.open(image_file).convert("RGB")
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+    # Kept in the chat history, so a thumbnail rather than the full image
+    return base64.b64encode(uploads.wrap(image_file).thumbnail_png(CHAT_THUMB_WIDTH)).decode()
 
-def extract_ollama_message(response_obj):
-    """
-    Extract assistant content from an Ollama response object (safe).
-    Returns string content or str(response_obj) fallback.
-    """
-    try:
-        # If it's an object with message attribute:
-        if hasattr(response_obj, "message") and response_obj.message is not None:
-            # Some SDKs have .message.content
-            msg = response_obj.message
-            if hasattr(msg, "content"):
-                return msg.content or ""
-            # maybe msg itself is dict-like
-            try:
-                return str(msg)
-            except Exception:
-                pass
-        # If it's a dict-like response
-        if isinstance(response_obj, dict):
-            m = response_obj.get("message", {})
-            if isinstance(m, dict):
-                return m.get("content", "") or ""
-            # sometimes nested
-            return str(response_obj)
-        # fallback to string
-        return str(response_obj)
-    except Exception:
-        return str(response_obj)
-
-def call_ollama_once(system_prompt, user_prompt, model_name="llama2:latest"):
+def call_ollama_once(system_prompt, user_prompt, task="chat", model_name=None):
     """
     Calls Ollama without streaming (single response) to avoid streaming-event logs.
+    The router picks host/model for `task` unless model_name pins one.
     Returns assistant text (string) or raises exception.
     """
     try:
-        resp = ollama.chat(
-            model=model_name,
-            messages=[
+        resp = ollama_client.chat(
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            # do NOT pass stream=True to avoid event objects
+            task=task,
+            model=model_name,
         )
-        content = extract_ollama_message(resp)
-        return content
+        return resp.text
     except Exception as e:
         # Re-raise so callers can catch and display errors
         raise
 
+def start_answer(system_prompt, user_prompt, task="chat"):
+    """
+    Streams the answer in a background thread that the chat page polls.
+    Short questions try the small model first (see cascade).
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    return ollama_client.supersede(
+        st.session_state, "generation",
+        lambda cancel: cascade.chat_stream("kamal", messages, task=task, cancel=cancel),
+        chat=st.session_state.current_chat,
+    )
+
+def finish_answer(job):
+    """Add the job's answer to the chat it was asked in."""
+    st.session_state.generation = None
+    chat = st.session_state.chats.get(job.info["chat"])
+    if job.error:
+        st.error(f"❌ Error while generating the answer:\n{job.error}")
+    if chat is not None and job.text:
+        chat["messages"].add("assistant", job.text + (" ⏹" if job.cancelled else ""))
+
+def stop_answer():
+    job = st.session_state.generation
+    if job is not None:
+        job.stop()
+        finish_answer(job)
+
+# Explicit user intent keywords, checked in this order (default: explain)
+INTENT_KEYWORDS = (
+    ("fix", ("fix", "error", "bug", "correct", "repair")),
+    ("explain", ("explain", "what does", "describe", "meaning")),
+    ("write", ("write", "implement", "create", "build", "solve")),
+    ("optimize", ("optimize", "improve", "refactor")),
+)
+
+def detect_intent(user_text: str) -> str:
+    """fix / explain / write / optimize from the user's message."""
+    ut_lower = user_text.lower() if user_text else ""
+    for intent, keywords in INTENT_KEYWORDS:
+        if any(k in ut_lower for k in keywords):
+            return intent
+    return "explain"
+
+def bot_bubble(content):
+    return f'<div class="chat-row bot"><div class="chat-bubble bot-msg">{content}</div></div>'
+
 
 # ------------------------------- #
 # SESSION INITIALIZATION
 # ------------------------------- #
 if "chats" not in st.session_state:
-    st.session_state.chats = {}
+    st.session_state.chats = shared_store.load_chats("kamal")   # {} unless served by serve.py
+    for chat in st.session_state.chats.values():
+        chat["messages"] = Conversation.from_json(chat["messages"])
 if "current_chat" not in st.session_state:
     st.session_state.current_chat = None
 if "account_open" not in st.session_state:
@@ -199,10 +249,18 @@ if "last_file" not in st.session_state:
 # image handling flags
 if "pending_image" not in st.session_state:
     st.session_state.pending_image = None          # holds uploaded image file (temp)
-if "last_uploaded_name" not in st.session_state:
-    st.session_state.last_uploaded_name = None     # avoid re-setting same upload on rerun
-if "processing" not in st.session_state:
-    st.session_state.processing = False
+if "last_upload" not in st.session_state:
+    st.session_state.last_upload = None            # upload_key of the upload handled last
+if "generation" not in st.session_state:
+    st.session_state.generation = None             # ollama_client.Generation while an answer streams
+if "documents" not in st.session_state:
+    st.session_state.documents = []                # uploaded PDFs, for Deep Research grounding
+if "research_job" not in st.session_state:
+    st.session_state.research_job = None           # research.Research while it runs
+if "image_job" not in st.session_state:
+    st.session_state.image_job = None              # imagegen.Job, queued or generating
+if "voice_job" not in st.session_state:
+    st.session_state.voice_job = None              # speech.Transcription while listening
 
 # create first chat if none
 if not st.session_state.current_chat:
@@ -237,6 +295,9 @@ with st.sidebar:
             st.info("**User:** demo_user@example.com")
         st.markdown('</div>', unsafe_allow_html=True)
 
+archive.render_sidebar("kamal", archived_chats, import_chat)
+metrics.render_debug_panel()
+
 # ------------------------------- #
 # MAIN PAGE: CHAT
 # ------------------------------- #
@@ -247,14 +308,25 @@ if st.session_state.page == "Chat":
 
     # Messages container
     st.markdown('<div class="messages-container">', unsafe_allow_html=True)
+    job = st.session_state.generation
+    if job is not None and job.done:
+        finish_answer(job)
+        job = None
     for msg in current_chat["messages"]:
-        role = msg.get("role", "assistant")
-        content = msg.get("content", "")
-        if role == "user":
+        content = msg.content
+        if msg.image:
+            content = (f"<img src='data:image/png;base64,{msg.image}' "
+                       f"style='max-width:200px;border-radius:10px;margin-bottom:8px; display:block;'/>{content}")
+        if msg.role == "user":
             html = f'<div class="chat-row user"><div class="chat-bubble user-msg">{content}</div></div>'
         else:
-            html = f'<div class="chat-row bot"><div class="chat-bubble bot-msg">{content}</div></div>'
+            html = bot_bubble(content)
         st.markdown(html, unsafe_allow_html=True)
+    if job is not None and job.info["chat"] == st.session_state.current_chat:
+        st.markdown(bot_bubble((job.text or "🤖 Generating answer...") + "▌"), unsafe_allow_html=True)
+        if st.button("⏹ Stop generating", key="answer_stop"):
+            stop_answer()
+            st.rerun()
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Chat input container (fixed)
@@ -272,28 +344,16 @@ if st.session_state.page == "Chat":
     with col_file:
         uploaded_file = st.file_uploader(
             "Upload file",
-            type=["txt", "pdf", "csv", "jpg", "jpeg", "png"],
+            type=["txt", "pdf", "csv", "jpg", "jpeg", "png", "wav", "aiff", "flac"],
             label_visibility="collapsed",
             key="chat_file_uploader"
         )
     st.markdown('</div>', unsafe_allow_html=True)
 
-    # handle voice recognition (only when pressed)
-    if voice_input:
+    # start voice recognition in the background (only when pressed)
+    if voice_input and st.session_state.voice_job is None:
         try:
-            st.info("🎙️ Listening... Speak now")
-            recognizer = sr.Recognizer()
-            with sr.Microphone() as source:
-                audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            try:
-                recognized = recognizer.recognize_google(audio)
-                # set prompt so the rest of the flow handles it (chat_input won't have a value)
-                prompt = recognized
-                st.success(f"Recognized: {recognized}")
-            except sr.UnknownValueError:
-                st.error("Could not understand audio")
-            except sr.RequestError:
-                st.error("Speech recognition service unavailable")
+            st.session_state.voice_job = speech.listen(speech.engine())
         except Exception as e:
             st.error(f"Microphone error: {e}")
 
@@ -301,191 +361,128 @@ if st.session_state.page == "Chat":
     # FILE UPLOAD HANDLING (images wait; others processed immediately)
     # -------------------------------
     if uploaded_file is not None:
-        # If new upload (different name), save into session_state.pending_image and track name
-        if uploaded_file.name != st.session_state.get("last_uploaded_name"):
-            st.session_state.last_uploaded_name = uploaded_file.name
+        # Only a new upload is handled; the same one stays in the widget across reruns
+        if upload_key(uploaded_file) != st.session_state.last_upload:
+            st.session_state.last_upload = upload_key(uploaded_file)
             if uploaded_file.type.startswith("image/"):
-                # keep the uploaded file object in pending_image (it stays across reruns)
-                st.session_state.pending_image = uploaded_file
+                # spool the upload once into pending_image (it stays across reruns)
+                st.session_state.pending_image = uploads.Upload(uploaded_file)
                 st.info(f"📸 Image '{uploaded_file.name}' is ready. Type a question or press Enter to send.")
+            elif uploaded_file.name.lower().endswith((".wav", ".aiff", ".flac")):
+                # recorded question: transcribe in the background like the 🎤 button
+                try:
+                    st.session_state.voice_job = speech.transcribe_file(speech.engine(), uploaded_file.getvalue())
+                except Exception as e:
+                    st.error(f"Speech recognition error: {e}")
             else:
                 # Non-image: process immediately and append to chat
                 file_content = process_file(uploaded_file)
-                current_chat["messages"].append({
-                    "role": "user",
-                    "content": f"📄 Uploaded file: {uploaded_file.name}\n\n{file_content[:1500]}"
-                })
-                # we processed a file so clear sentinel to avoid processing again
-                st.session_state.last_uploaded_name = None
-
-    # show a small preview next to input (like ChatGPT): display only when pending_image exists
-    # Only show preview if not processing any request
-    if prompt is not None:
-        if st.session_state.processing:
-            st.warning("Already processing a previous request. Please wait.")
+                if file_content is not None:  # PDFs add their own messages
+                    current_chat["messages"].add(
+                        "user", f"📄 Uploaded file: {uploaded_file.name}\n\n{file_content[:1500]}"
+                    )
+                # the sentinel stays set: the answer polls rerun this block every 0.3 s
+
+    # poll the voice job: show the partial transcript, then use the final text as the prompt.
+    # A typed message goes first; polling (and its rerun) resumes on the next run
+    voice_job = st.session_state.voice_job
+    if voice_job is not None and prompt is None:
+        if not voice_job.done:
+            st.info(f"🎙️ Listening... {voice_job.text}")
+            if st.button("⏹ Stop", key="voice_stop"):
+                voice_job.stop()
+            time.sleep(0.3)
+            st.rerun()
+        st.session_state.voice_job = None
+        if voice_job.error:
+            st.error(voice_job.error)
+        elif voice_job.text:
+            # set prompt so the rest of the flow handles it (chat_input won't have a value)
+            prompt = voice_job.text
+            st.success(f"Recognized: {voice_job.text}")
         else:
-            st.session_state.processing = True
-            try:
-                user_text = prompt.strip()
-                has_image = st.session_state.pending_image is not None
-
-                # Case 1: Image + Text
-                if has_image:
-                    image_file = st.session_state.pending_image
-                    img_name = image_file.name
-
-                    # --- OCR step ---
-                    with st.spinner("🔍 Extracting text from image..."):
-                        ocr_text = perform_ocr(image_file)
-                        ocr_text = clean_ocr_code(ocr_text)
-                    st.info(f"🧾 OCR Extracted Text:\n\n{ocr_text[:1000]}")  # preview for debugging
-
-                    # Detect if it looks like code
-                    is_code = looks_like_code(ocr_text)
-
-                    # 3) Detect explicit user intent keywords (fix / explain / write / optimize)
-                    user_intent = "explain"  # default
-                    ut_lower = user_text.lower() if user_text else ""
-                    if any(k in ut_lower for k in ["fix", "error", "bug", "correct", "repair"]):
-                        user_intent = "fix"
-                    elif any(k in ut_lower for k in ["explain", "what does", "describe", "meaning"]):
-                        user_intent = "explain"
-                    elif any(k in ut_lower for k in ["write", "implement", "create", "build", "solve"]):
-                        user_intent = "write"
-                    elif any(k in ut_lower for k in ["optimize", "improve", "refactor"]):
-                        user_intent = "optimize"
-
-                    # --- Construct AI prompt including OCR text ---
-                    if is_code:
-                        full_prompt = f"""
-                    You are CodeGene AI, a highly skilled AI programmer and code mentor.
-                    INPUT (from image OCR):
-                    {ocr_text}
-
-                    USER MESSAGE / INTENT:
-                    {user_text or '(no text provided)'}
-                    Detected intent: {user_intent}
-                    
-
-                    The following text was extracted from an image using OCR. It may be a Python code snippet, 
-                    assignment, or programming question. You must decide the correct intent automatically.
-
-                    Follow these rules:
-
-                    1. 🧩 If the code looks complete and correct → 
-                    Explain what it does line-by-line and describe its logic and output.
-
-                    2. 🛠️ If the code has syntax or logic errors → 
-                    Fix the code fully and provide the corrected version inside:
-                        ```python
-                        # Corrected Code Here
-                        ```
-                    Then, explain what was wrong and how you fixed it.
-
-                    3. 🧠 If the text is a question asking for code (e.g., "write a function that...") → 
-                    Write a complete, efficient, and readable solution using best practices, 
-                    followed by a detailed explanation.
-
-                    4. 💬 Always include a clear **final explanation** after any code.
-
-                    5. 🧾 Never skip showing the corrected or written code in ```python ... ``` format.
-
-                    Here is the extracted text or code to analyze:
-                    {ocr_text}
-                    """
-                    else:
-                        full_prompt = f"""
-                        You are CodeGene AI, a helpful assistant.
-                        The user uploaded an image named '{img_name}' and asked:
-                        {user_text}
-
-                        Extracted text from the image:
-                        {ocr_text}
-                        Determine automatically whether the content is:
-                        - Code (Python, Java, JS, etc.)
-                        - A question about code
-                        - A general query
-
-                        If it is code:
-                        - Correct and explain it if broken.
-                        - Explain it line-by-line if correct.
-                        - Provide rewritten or optimized code if the user asks "improve" or "optimize".
-                        If it is not code:
-                        - Just answer clearly and precisely in human language.
-
-                        Output should always include:
-                        - ```python``` block when returning code
-                        - Bullet points or numbered explanation
-                        - Concise summary at the end
-                        """
-
-                    # --- Add to chat visually ---
-                    img_b64 = image_to_base64(image_file)
-                    st.session_state.chats[st.session_state.current_chat]["messages"].append({
-                        "role": "user",
-                        "content": f"<img src='data:image/png;base64,{img_b64}' "
-                                f"style='max-width:200px;border-radius:10px;margin-bottom:8px; display:block;'/>{user_text}"
-                    })
-
-                    # Auto-update chat title for image uploads
-                    if current_chat["title"] == "New Chat":
-                        current_chat["title"] = f"Image: {img_name}"
-
-                    # --- Clear the pending image immediately ---
-                    st.session_state.pending_image = None
-
-                    # --- Get AI response ---
-                    with st.spinner("🤖 Generating answer..."):
-                        answer = call_ollama_once(
-                            system_prompt=(
-                                    "You are CodeGene AI, an expert programming assistant. "
-                                    "When a user asks to fix code, you MUST output a fully corrected and runnable version "
-                                    "inside triple backticks labeled with the language (e.g., ```python). "
-                                    "You MUST fix all logical, syntax, and runtime errors. "
-                                    "Do NOT include greetings, intros, or meta text. "
-                                    "After the code, give a concise bullet-point explanation of what was fixed. "
-                                    "Do NOT repeat the user’s code or text."
-                            ),
-                            user_prompt=full_prompt,
-                            model_name="llama2:latest"
-                        )
-
-
-                    st.session_state.chats[st.session_state.current_chat]["messages"].append({
-                        "role": "assistant",
-                        "content": answer
-                    })
-
-                # Case 2: Text-only message
+            st.error("Could not understand audio")
+
+    if prompt is not None:
+        # A new prompt supersedes an answer that is still streaming; its partial
+        # text stays in the chat, ahead of the new question
+        stop_answer()
+        try:
+            user_text = prompt.strip()
+            has_image = st.session_state.pending_image is not None
+
+            # Case 1: Image + Text
+            if has_image:
+                image_file = st.session_state.pending_image
+                img_name = image_file.name
+
+                # Intent only needs the user's text, so it is known before OCR ends
+                user_intent = detect_intent(user_text)
+
+                # --- OCR step, with the chat thumbnail encoded alongside ---
+                with st.spinner("🔍 Extracting text from image..."), \
+                        ThreadPoolExecutor(max_workers=1) as pool:
+                    img_b64_future = pool.submit(image_to_base64, image_file)
+                    ocr_text = clean_ocr_code(perform_ocr(image_file))
+                st.info(f"🧾 OCR Extracted Text:\n\n{ocr_text[:1000]}")  # preview for debugging
+
+                # Detect if it looks like code
+                is_code = looks_like_code(ocr_text)
+
+                # --- Construct AI prompt including OCR text ---
+                if is_code:
+                    template = prompts.get("image_code", intent=user_intent)
                 else:
-                    st.session_state.chats[st.session_state.current_chat]["messages"].append({
-                        "role": "user",
-                        "content": user_text
-                    })
+                    template = prompts.get("image_text")
+                full_prompt = template.render(
+                    user_text=user_text or "(no text provided)",
+                    intent=user_intent,
+                    img_name=img_name,
+                    ocr_text=ocr_text,
+                )
 
-                    # 🔹 Auto-update chat title
-                    if current_chat["title"] == "New Chat" and user_text:
-                        current_chat["title"] = user_text[:40] + ("..." if len(user_text) > 40 else "")
+                # --- Add to chat visually ---
+                st.session_state.chats[st.session_state.current_chat]["messages"].add(
+                    "user", user_text, image=img_b64_future.result()
+                )
 
-                    with st.spinner("🤖 Generating answer..."):
-                        answer = call_ollama_once(
-                            system_prompt="system_prompt",
-                            user_prompt=user_text,
-                            model_name="llama2:latest"
-                        )
+                # Auto-update chat title for image uploads
+                if current_chat["title"] == "New Chat":
+                    current_chat["title"] = f"Image: {img_name}"
 
+                # --- Clear the pending image immediately ---
+                st.session_state.pending_image = None
 
-                    st.session_state.chats[st.session_state.current_chat]["messages"].append({
-                        "role": "assistant",
-                        "content": answer
-                    })
+                # --- Stream the AI response into the chat as it is generated ---
+                start_answer(
+                    system_prompt=prompts.get("code_system").render(),
+                    user_prompt=full_prompt,
+                    task="code" if is_code else "long"
+                )
 
-                st.session_state.processing = False
-                st.rerun()
+            # Case 2: Text-only message
+            else:
+                st.session_state.chats[st.session_state.current_chat]["messages"].add("user", user_text)
 
-            except Exception as e:
-                st.error(f"❌ Error while processing image or question:\n{e}")
-                st.session_state.processing = False
+                # 🔹 Auto-update chat title
+                if current_chat["title"] == "New Chat" and user_text:
+                    current_chat["title"] = user_text[:40] + ("..." if len(user_text) > 40 else "")
+
+                start_answer(
+                    system_prompt=prompts.get("chat_system").render(),
+                    user_prompt=user_text,
+                    task=classify(user_text)
+                )
+
+            st.rerun()
+
+        except Exception as e:
+            st.error(f"❌ Error while processing image or question:\n{e}")
+
+    # poll the answer streaming in the background
+    if st.session_state.generation is not None:
+        time.sleep(0.3)
+        st.rerun()
 
 
 # ------------------------------- #
@@ -503,206 +500,79 @@ elif st.session_state.page == "Tools":
 elif st.session_state.page == "ImageGen":
     st.title("🖼️ Image Generator")
     img_prompt = st.text_input("Enter prompt for image generation")
+    col1, col2 = st.columns(2)
+    with col1:
+        seed = st.number_input("Seed", min_value=0, max_value=2**31 - 1, value=42, step=1)
+    with col2:
+        steps = st.slider("Steps", 1, imagegen.MAX_STEPS, imagegen.DEFAULT_STEPS)
     if st.button("Generate Image"):
-        st.info(f"Image generated for: {img_prompt} (placeholder)")
+        if not img_prompt.strip():
+            st.warning("⚠️ Please enter a prompt first.")
+        else:
+            if st.session_state.image_job is not None:
+                st.session_state.image_job.stop()
+            st.session_state.image_job = imagegen.submit(img_prompt.strip(), seed=seed, steps=steps)
+
+    # Images are generated one at a time by a background worker; show progress
+    job = st.session_state.image_job
+    if job is not None:
+        if job.status == "queued":
+            st.caption(f"Queued: position {job.position or 1} of {max(1, imagegen.pending())}")
+        elif not job.done:
+            st.progress(job.progress, text="Loading model..." if job.status == "loading" else "Generating...")
+        if job.png:
+            st.image(job.png, caption=f"{job.prompt} (seed {job.seed})" + (" · cached" if job.cached else ""))
+        if job.error:
+            st.error(f"❌ Image generation failed: {job.error}")
+        if not job.done:
+            if st.button("⏹ Stop"):
+                job.stop()
+                st.session_state.image_job = None
+                st.rerun()
+            time.sleep(0.3)
+            st.rerun()
 
 elif st.session_state.page == "Research":
     st.title("🔎 Deep Research")
     query = st.text_area("Enter your research query", height=150)
-    model_choice = st.radio("Select model", ["llama2:latest"], index=0)
+    model_choice = st.radio("Select model", router.models("research"), index=0)
+    documents = st.session_state.documents
+    use_documents = bool(documents) and st.checkbox(
+        f"Ground answers in my uploaded PDFs ({len(documents)})", value=True
+    )
     if st.button("Run Research"):
         if not query.strip():
             st.warning("⚠️ Please enter a query first.")
         else:
-            try:
-                assistant_text = call_ollama_once(
-                    system_prompt="You are a deep research assistant. Provide a detailed, factual, structured answer.",
-                    user_prompt=query,
-                    model_name=model_choice
-                )
-                st.markdown("**Assistant:**")
-                st.markdown(assistant_text)
-            except Exception as e:
-                st.error(f"Error calling Ollama: {e}\n{traceback.format_exc()}")
-
-#style.css
-/* Adjust the main app container to account for the fixed chat input */ 
-.stApp { 
-    padding-bottom: 7rem; 
-} 
-/* ============ Messages area ============ */ 
-.messages-container { 
-    padding: 2rem 3rem; 
-    padding-bottom: 8rem; /* ensure chat input doesn't overlap messages */ 
-    overflow-y: auto; 
-    box-sizing: border-box; 
-} 
-/* Each row is a flex row — this is what allows proper left/right alignment 
-*/ 
-.chat-row { 
-    display: flex; 
-    width: 100%; 
-    margin: 6px 0; 
-    box-sizing: border-box; 
-} 
-.chat-row.user { justify-content: flex-end; } 
-.chat-row.bot  { justify-content: flex-start; } 
- 
-/* Bubble */ 
-.chat-bubble { 
-    max-width: 70%; 
-    padding: 10px 14px; 
-    border-radius: 14px; 
-    font-size: 0.95rem; 
-    line-height: 1.3; 
-    word-wrap: break-word; 
-    box-shadow: none; 
-} 
-.user-msg { 
-    background-color: #dbefff; 
-    border-bottom-right-radius: 6px; 
-    text-align: right; 
-} 
-.bot-msg { 
-    background-color: #f1f1f1; 
-    border-bottom-left-radius: 6px; 
-    text-align: left; 
-} 
-/* Sidebar Styling */ 
-[data-testid="stSidebar"] { 
-    display: flex; 
-    flex-direction: column; 
-} 
-[data-testid="stSidebarNav"] { 
-    flex-grow: 1; 
-    overflow-y: auto; 
-    padding-bottom: 2rem; 
-} 
-.account-footer { 
-    padding: 1rem; 
-    border-top: 1px solid rgba(22, 23, 26, 0.1); 
-    background-color: #f0f2f6; 
-
- 
-} 
-.stButton>button { 
-    background-color: transparent !important; 
-    border: none !important; 
-    box-shadow: none !important; 
-    text-align: left; 
-    padding: 0.5rem 0.5rem; 
-    width: 100%; 
-    color: #000; 
-    font-size: 1rem; 
-    transition: background-color 0.1s ease; 
-} 
-.stButton>button:hover, .stButton>button:focus { 
-    background-color: rgba(22, 23, 26, 0.05) !important; 
-    outline: none !important; 
-} 
-/* Main Page Styling */ 
-[data-testid="stAppViewBlockContainer"] h3 { 
-    padding: 0 !important; 
-    margin: 0 !important; 
-} 
- 
-/* Chat Input Styling */ 
-.stChatInputContainer { 
-    position: fixed; 
-    bottom: 0; 
-    left: 250px; 
-    width: calc(100% - 250px); 
-    background-color: #fff; 
-    padding: 1rem; 
-    border-top: 1px solid rgba(22, 23, 26, 0.1); 
-    z-index: 999; 
-    box-sizing: border-box; 
-    display: flex; 
-    align-items: center; 
-    gap: 10px; 
-} 
-/* ============ File uploader: hide drag text but keep Browse button 
-============ */ 
-/* The dropzone container */ 
-/* Hide drag-and-drop text */ 
-div[data-testid="stFileUploaderDropzoneInstructions"] { 
-    display: none !important; 
-} 
- 
-/* Hide limit text */ 
-div[data-testid="stFileUploaderDetails"] { 
-    display: none !important; 
-} 
- 
- 
-/* remove large instruction paragraph if present */ 
-div[data-testid="stFileUploaderDropzone"] p { 
-    display: none !important; 
-} 
- 
-/* make the button small and inline */ 
-div[data-testid="stFileUploaderDropzone"] button { 
-    margin-left: 6px !important; 
-    padding: 6px 10px !important; 
-    height: 40px !important; 
- 
- 
-} 
-/* ------------------------------ 
-   REMOVE uploader background completely ------------------------------ */ 
-/* Outer uploader container */ 
-div[data-testid="stFileUploader"] { 
-    background: transparent !important; 
-    border: none !important; 
-    box-shadow: none !important; 
-    padding: 0 !important; 
-    margin: 0 !important; 
-    display: inline-flex !important; 
-    align-items: center !important; 
-} 
- 
-/* Dropzone area */ 
-div[data-testid="stFileUploaderDropzone"] { 
-    background: transparent !important; 
-    border: none !important; 
-    box-shadow: none !important; 
-    padding: 0 !important; 
-    margin: 0 !important; 
-} 
- 
-/* Inner section that sometimes adds bg */ 
-div[data-testid="stFileUploader"] section { 
-    background: transparent !important; 
-    border: none !important; 
-    box-shadow: none !important; 
-    padding: 0 !important; 
-    margin: 0 !important; 
-} 
- 
-/* Target *all* uploader children to be transparent */ 
-div[data-testid="stFileUploader"] * { 
-    background: transparent !important; 
-    border: none !important; 
-    box-shadow: none !important; 
-} 
- 
-/* Style Browse Files button like mic button */ 
-div[data-testid="stFileUploader"] button { 
-    background-color: white !important; 
-    border: 1px solid rgba(0, 0, 0, 0.2) !important; 
-    border-radius: 6px !important; 
-    padding: 0.4rem 0.6rem !important; 
-    font-size: 1rem !important; 
-    cursor: pointer !important; 
-    transition: background-color 0.2s ease; 
-} 
- 
-/* Hover effect */ 
-div[data-testid="stFileUploader"] button:hover { 
-    background-color: rgba(22, 23, 26, 0.05) !important; 
-} 
-/* Keep it inline with mic button */ 
-div[data-testid="stFileUploader"] { 
-    display: inline-flex !important; 
-    align-items: center !important; 
-    margin-left: 4px !important;  /* small gap from mic */
+            if st.session_state.research_job is not None:
+                st.session_state.research_job.stop()
+            st.session_state.research_job = research.Research(
+                query.strip(), model=model_choice, documents=documents if use_documents else ()
+            )
+
+    # Sub-questions are researched in parallel in the background; show progress
+    job = st.session_state.research_job
+    if job is not None:
+        st.caption(f"Status: {job.status}")
+        for q in job.questions:
+            answer = job.answers.get(q, "")
+            mark = "✅" if answer else ("⚠️" if q in job.answers else "⏳")
+            with st.expander(f"{mark} {q}"):
+                st.markdown(answer or "...")
+        if job.text:
+            st.markdown("**Assistant:**")
+            st.markdown(job.text + ("" if job.done else "▌"))
+            if job.sources:
+                st.caption("Sources: " + " · ".join(f"[{n}] {name}" for n, name in job.sources))
+        if job.error:
+            st.error(f"Error calling Ollama: {job.error}")
+        if not job.done:
+            if st.button("⏹ Stop research"):
+                job.stop()
+            time.sleep(0.5)
+            st.rerun()
+
+# ------------------------------- #
+# PERSIST (multi-worker deployments, see serve.py)
+# ------------------------------- #
+shared_store.sync_chats("kamal", st.session_state.chats, only=shared_store.changed(st.session_state.chats))
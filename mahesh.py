@@ -1,58 +1,55 @@
 #app.py
 import streamlit as st
 import uuid
-import subprocess
-from PIL import Image
-import pytesseract
+import archive
+import metrics
+import ocr
+import ollama_client
+import shared_store
+from conversation import Conversation
+from model_router import router, classify
 
 # -------------------
 # Function to stream Ollama LLaMA2 responses
 # -------------------
-def stream_ollama(prompt, model="llama2"):
+def stream_ollama(prompt, task="chat", cancel=None):
     """
-    Streams response from Ollama (LLaMA2) word by word.
+    Streams response from Ollama token by token over HTTP.
+    The router picks the host and model for the task; the task's generation
+    profile caps the answer length (see gen_profiles). Cancelling `cancel`
+    (an ollama_client.CancelToken) closes the stream, which stops Ollama.
     """
     try:
-        process = subprocess.Popen(
-            ["ollama", "run", model],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        # Send prompt
-        process.stdin.write(prompt)
-        process.stdin.close()
-
-        # Stream words
-        for line in process.stdout:
-            yield line.strip()
-
-        process.stdout.close()
-        process.wait()
-
-    except Exception as e:
+        for chunk in ollama_client.generate_stream(prompt, task=task, cancel=cancel):
+            if chunk.text:
+                yield chunk.text
+    except ollama_client.Cancelled:
+        return
+    except ollama_client.OllamaError as e:
         yield f"⚠️ Could not connect to Ollama: {e}"
 
 # -------------------
 # OCR function with language support
 # -------------------
-def extract_text_from_image(uploaded_file, lang_code="eng"):
+def extract_text_from_image(uploaded_file, lang_code=ocr.AUTO):
     """
-    Performs OCR on the uploaded image with the given language code.
+    Performs OCR on the uploaded image with the given language code
+    ("auto" detects the script first). Returns (text, language used).
     """
     try:
-        image = Image.open(uploaded_file)
-        text = pytesseract.image_to_string(image, lang=lang_code)
-        return text.strip()
+        with metrics.stage("ocr", file=uploaded_file.name, lang=lang_code):
+            data = uploaded_file.getvalue()
+            return ocr.image_to_string(ocr.digest(data), data, lang=lang_code)
     except Exception as e:
-        return f"⚠️ OCR failed: {e}"
+        return f"⚠️ OCR failed: {e}", lang_code
 
 # -------------------
 # Initialize session state
 # -------------------
 if "chats" not in st.session_state:
-    st.session_state.chats = {}
+    st.session_state.chats = shared_store.load_chats("mahesh")  # {} unless served by serve.py
+    for chat in st.session_state.chats.values():
+        chat["messages"] = Conversation.from_json(chat["messages"])
 if "current_chat" not in st.session_state:
     st.session_state.current_chat = None
 
@@ -64,7 +61,7 @@ st.sidebar.title("Chat Menu")
 # ✅ New Chat button: resets input state too
 if st.sidebar.button("New Chat"):
     new_id = str(uuid.uuid4())[:8]
-    st.session_state.chats[new_id] = {"name": "Untitled Chat", "messages": []}
+    st.session_state.chats[new_id] = {"name": "Untitled Chat", "messages": Conversation()}
     st.session_state.current_chat = new_id
     # Reset file upload, input, OCR text, etc.
     if "file_uploader" in st.session_state:
@@ -75,7 +72,7 @@ if st.sidebar.button("New Chat"):
 
 if st.sidebar.button("Clear Current Chat"):
     if st.session_state.current_chat:
-        st.session_state.chats[st.session_state.current_chat]["messages"] = []
+        st.session_state.chats[st.session_state.current_chat]["messages"] = Conversation()
         st.session_state.chats[st.session_state.current_chat]["name"] = "Untitled Chat"
         st.rerun()
 
@@ -97,6 +94,22 @@ if st.session_state.current_chat:
 else:
     st.sidebar.write("No active chat")
 
+# Export / import whole chat histories
+def import_chat(chat):
+    chat_id = chat.get("id") or str(uuid.uuid4())[:8]
+    if chat_id in st.session_state.chats:
+        return      # already here (archive imported twice)
+    st.session_state.chats[chat_id] = {
+        "name": archive.title_of(chat),
+        "messages": Conversation.from_json(chat.get("messages")),
+    }
+
+archive.render_sidebar(
+    "mahesh",
+    lambda: (dict(chat, id=chat_id) for chat_id, chat in st.session_state.chats.items()),
+    import_chat,
+)
+
 # Chat history display
 st.sidebar.subheader("Chat History")
 for chat_id, chat_data in st.session_state.chats.items():
@@ -105,6 +118,8 @@ for chat_id, chat_data in st.session_state.chats.items():
             st.session_state.current_chat = chat_id
             st.rerun()
 
+metrics.render_debug_panel()
+
 # -------------------
 # Main Chat Window
 # -------------------
@@ -117,11 +132,17 @@ else:
     chat_data = st.session_state.chats[chat_id]
 
     st.subheader(chat_data["name"])
-    st.markdown("**Model:** llama2")
+    st.markdown(f"**Model:** {' / '.join(router.models('chat'))} (auto)")
+
+    # A rerun means the previous run ended or was interrupted (Stop, a new
+    # prompt); an answer it left streaming is not wanted any more
+    if st.session_state.get("generation_cancel") is not None:
+        st.session_state.generation_cancel.cancel()
+        st.session_state.generation_cancel = None
 
     # Display conversation for this chat ONLY
-    for role, text in chat_data["messages"]:
-        st.chat_message(role).markdown(text)
+    for msg in chat_data["messages"]:
+        st.chat_message(msg.role).markdown(msg.content)
 
     # =====================
     # 🔸 OCR Image Upload with Language Selection
@@ -135,6 +156,7 @@ else:
         lang_choice = st.selectbox(
             "Language",
             options={
+                ocr.AUTO: "Auto-detect",
                 "eng": "English",
                 "hin": "Hindi",
                 "tam": "Tamil",
@@ -154,9 +176,9 @@ else:
     ocr_text = None
     if uploaded_image:
         with st.spinner("🔍 Extracting text from image..."):
-            ocr_text = extract_text_from_image(uploaded_image, lang_code=lang_code)
+            ocr_text, used_lang = extract_text_from_image(uploaded_image, lang_code=lang_code)
         if ocr_text:
-            st.success("✅ Text extracted from image:")
+            st.success(f"✅ Text extracted from image ({used_lang}):")
             st.text_area("Extracted Text", ocr_text, height=150, key=f"ocr_text_{chat_id}")
 
     # =====================
@@ -166,21 +188,30 @@ else:
 
     if user_input:
         # Add and display user message
-        chat_data["messages"].append(("user", user_input))
+        chat_data["messages"].add("user", user_input)
         st.chat_message("user").markdown(user_input)
 
         # Name chat after first input
         if chat_data["name"] == "Untitled Chat":
             chat_data["name"] = user_input[:30]
 
-        # Stream assistant response
+        # Stream assistant response; Stop (or a new prompt) reruns the script,
+        # which interrupts this loop and cancels the generation above
+        token = st.session_state.generation_cancel = ollama_client.CancelToken()
         response_text = ""
-        with st.chat_message("assistant"):
-            placeholder = st.empty()
-            for chunk in stream_ollama(user_input):
-                response_text += " " + chunk
-                placeholder.markdown(response_text + "▌")
-            placeholder.markdown(response_text)
-
-        # Save assistant response
-        chat_data["messages"].append(("assistant", response_text.strip()))
+        try:
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                st.button("⏹ Stop", key="stop_generation")
+                for chunk in stream_ollama(user_input, task=classify(user_input), cancel=token):
+                    response_text += chunk
+                    placeholder.markdown(response_text + "▌")
+                placeholder.markdown(response_text)
+        finally:
+            # Save assistant response, or as much of it as was generated
+            chat_data["messages"].add("assistant", response_text.strip())
+
+# -------------------
+# Persist chats (multi-worker deployments, see serve.py)
+# -------------------
+shared_store.sync_chats("mahesh", st.session_state.chats, only=shared_store.changed(st.session_state.chats))
@@ -0,0 +1,281 @@
+# metrics.py
+"""
+Latency/throughput instrumentation for model calls and extraction stages.
+
+    with metrics.queued(submitted_at):       # work that waited in a queue or pool
+        with metrics.request("chat") as rec: # queue wait runs from submitted_at
+            rec.sent(backend)                # request leaves for a backend
+            rec.first_token()                # first streamed chunk arrived
+            rec.finish(reply)                # token counts from the final Reply
+
+    with metrics.stage("ocr", file=name):    # OCR / PDF extraction timing
+        ...
+
+Records are kept in a small in-memory ring for the Streamlit debug panel and
+aggregated into Prometheus-style counters. Optional exports, both off by default:
+
+    METRICS_LOG=/path/metrics.jsonl   append every record as one JSON line
+    METRICS_PORT=9464                 serve the aggregates as Prometheus text
+    METRICS_PANEL=1                   show the debug panel (or add ?debug=1 to the URL)
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+RECENT = 200  # records kept for the debug panel
+
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+_recent = deque(maxlen=RECENT)
+_counters = defaultdict(float)   # (metric name, labels tuple) -> value
+_server = None
+_queued = threading.local()      # .since: submit time for the thread's next request
+
+
+class RequestRecord:
+    __slots__ = ("kind", "backend", "model", "status", "error",
+                 "queued_at", "sent_at", "first_token_at", "done_at",
+                 "prompt_tokens", "eval_tokens", "server_tokens_per_s")
+
+    def __init__(self, kind, queued_at=None):
+        self.kind = kind
+        self.backend = None
+        self.model = None
+        self.status = "ok"
+        self.error = None
+        self.queued_at = time.monotonic() if queued_at is None else queued_at
+        self.sent_at = None
+        self.first_token_at = None
+        self.done_at = None
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.server_tokens_per_s = 0.0
+
+    def sent(self, backend):
+        # Called again on failover; the last backend tried is the one that counts
+        self.backend = backend.name
+        self.model = backend.model
+        self.sent_at = time.monotonic()
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def finish(self, reply):
+        self.model = reply.model or self.model
+        self.prompt_tokens = reply.prompt_eval_count
+        self.eval_tokens = reply.eval_count
+        self.server_tokens_per_s = reply.tokens_per_second
+
+    @property
+    def queue_wait(self):
+        return (self.sent_at or self.done_at) - self.queued_at
+
+    @property
+    def ttft(self):
+        return self.first_token_at - self.queued_at if self.first_token_at else None
+
+    @property
+    def total(self):
+        return self.done_at - self.queued_at
+
+    @property
+    def tokens_per_s(self):
+        """Server-reported speed if known, else eval tokens over wall generation time."""
+        if self.server_tokens_per_s:
+            return self.server_tokens_per_s
+        start = self.first_token_at or self.sent_at
+        if self.eval_tokens and start and self.done_at > start:
+            return self.eval_tokens / (self.done_at - start)
+        return 0.0
+
+    def to_dict(self):
+        return {
+            "type": "request",
+            "ts": time.time(),
+            "kind": self.kind,
+            "backend": self.backend,
+            "model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "queue_wait_s": round(self.queue_wait, 4),
+            "ttft_s": round(self.ttft, 4) if self.ttft is not None else None,
+            "total_s": round(self.total, 4),
+            "prompt_tokens": self.prompt_tokens,
+            "eval_tokens": self.eval_tokens,
+            "tokens_per_s": round(self.tokens_per_s, 2),
+        }
+
+
+@contextmanager
+def queued(since):
+    """The next request made in this thread was submitted at `since`.
+
+    Background work (ollama_client.Generation, research sub-questions waiting
+    for a pool slot) is queued before its thread gets to the request; this
+    starts the request's queue wait, TTFT and total at submission. Only the
+    first request counts it: a retry or follow-up request did not wait.
+    """
+    _queued.since = since
+    try:
+        yield
+    finally:
+        _queued.since = None
+
+
+@contextmanager
+def request(kind):
+    since, _queued.since = getattr(_queued, "since", None), None
+    rec = RequestRecord(kind, since)
+    try:
+        yield rec
+    except GeneratorExit:
+        rec.status = "abandoned"
+        raise
+    except Exception as e:
+        rec.status = getattr(e, "status", "error")   # ollama_client.Cancelled: "cancelled"
+        rec.error = str(e)[:200]
+        raise
+    finally:
+        rec.done_at = time.monotonic()
+        _emit_request(rec)
+
+
+@contextmanager
+def stage(name, **labels):
+    """Time one processing stage (ocr, pdf_extract, ...)."""
+    start = time.monotonic()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        _emit_stage(name, time.monotonic() - start, status, labels)
+
+
+def _emit_request(rec):
+    row = rec.to_dict()
+    labels = (("kind", rec.kind), ("model", rec.model or ""), ("status", rec.status))
+    with _lock:
+        _recent.append(row)
+        _counters[("ollama_requests_total", labels)] += 1
+        _counters[("ollama_request_seconds_sum", labels)] += rec.total
+        _counters[("ollama_queue_wait_seconds_sum", labels)] += rec.queue_wait
+        if rec.ttft is not None:
+            _counters[("ollama_ttft_seconds_sum", labels)] += rec.ttft
+            _counters[("ollama_ttft_seconds_count", labels)] += 1
+        _counters[("ollama_prompt_tokens_total", labels)] += rec.prompt_tokens
+        _counters[("ollama_eval_tokens_total", labels)] += rec.eval_tokens
+    _write_log(row)
+
+
+def _emit_stage(name, seconds, status, labels):
+    row = {"type": "stage", "ts": time.time(), "stage": name, "status": status,
+           "seconds": round(seconds, 4), **labels}
+    key = (("stage", name), ("status", status))
+    with _lock:
+        _recent.append(row)
+        _counters[("stage_runs_total", key)] += 1
+        _counters[("stage_seconds_sum", key)] += seconds
+    _write_log(row)
+
+
+def count(name, value=1, **labels):
+    """Add to a Prometheus counter (for callers outside the request/stage records)."""
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        _counters[(name, key)] += value
+
+
+def _write_log(row):
+    path = os.environ.get("METRICS_LOG")
+    if not path:
+        return
+    line = json.dumps(row, ensure_ascii=False) + "\n"
+    with _log_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def recent():
+    with _lock:
+        return list(_recent)
+
+
+def prometheus_text():
+    """Aggregates in the Prometheus text exposition format."""
+    with _lock:
+        items = sorted(_counters.items())
+    lines = []
+    for (name, labels), value in items:
+        label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"{name}{{{label_str}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port=None):
+    """Start (once per process) a background HTTP endpoint serving prometheus_text()."""
+    global _server
+    port = port or os.environ.get("METRICS_PORT")
+    if _server is not None or not port:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("127.0.0.1", int(port)), Handler)
+            except OSError:
+                # Another worker on this box already owns the port
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def render_debug_panel():
+    """Sidebar expander with recent timings; only shown when enabled."""
+    import streamlit as st
+    import cascade
+    import gen_profiles
+    from model_router import router
+
+    if not (os.environ.get("METRICS_PANEL") or st.query_params.get("debug")):
+        return
+    with st.sidebar.expander("⏱️ Performance", expanded=False):
+        rows = recent()
+        requests_ = [r for r in rows if r["type"] == "request"]
+        stages = [r for r in rows if r["type"] == "stage"]
+        if requests_:
+            st.caption("Model requests (latest last)")
+            st.dataframe(requests_[-20:], use_container_width=True)
+        if stages:
+            st.caption("Extraction stages")
+            st.dataframe(stages[-20:], use_container_width=True)
+        st.caption("Backends")
+        st.dataframe(router.stats(), use_container_width=True)
+        st.caption("Generation budgets (num_predict)")
+        st.dataframe(gen_profiles.stats(), use_container_width=True)
+        drafts = cascade.stats()
+        if drafts:
+            st.caption("Draft model cascade")
+            st.dataframe(drafts, use_container_width=True)
+
+
+serve_prometheus()
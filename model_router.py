@@ -0,0 +1,167 @@
+# model_router.py
+"""
+Picks which local Ollama host/model serves a request.
+
+Backends are read from the OLLAMA_BACKENDS environment variable (a JSON list),
+falling back to the single local server the apps always used:
+
+    OLLAMA_BACKENDS='[
+        {"host": "http://10.0.0.5:11434", "model": "tinyllama", "tasks": ["chat", "draft"]},
+        {"host": "http://10.0.0.6:11434", "model": "llama2", "tasks": ["long", "code", "summarize", "research"]}
+    ]'
+
+Each backend keeps a rolling latency average and error window. A request for a
+task goes to the healthy backend with the lowest expected wait (latency scaled by
+requests already in flight); backends that keep failing sit out a cooldown.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_HOST = "http://localhost:11434"
+DEFAULT_BACKENDS = [
+    {"host": DEFAULT_HOST, "model": "tinyllama", "tasks": ["chat", "draft"]},
+    {"host": DEFAULT_HOST, "model": "llama2", "tasks": ["chat", "long", "code", "summarize", "research"]},
+]
+
+TASKS = ("chat", "draft", "long", "code", "summarize", "research")
+SHORT_CHAT_CHARS = 200  # anything longer is routed as a "long" request
+
+ERROR_WINDOW = 20       # last N outcomes kept per backend
+MAX_ERROR_RATE = 0.5    # above this the backend is considered unhealthy
+MIN_SAMPLES = 3         # outcomes needed before the error rate is trusted
+COOLDOWN_SECONDS = 30   # how long an unhealthy backend is skipped
+EWMA_ALPHA = 0.3        # weight of the newest latency sample
+
+
+class Backend:
+    """One host/model pair plus its live health numbers."""
+
+    def __init__(self, host, model, tasks=None):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.tasks = set(tasks or TASKS)
+        self.latency = None          # EWMA of request seconds, None until first sample
+        self.outcomes = deque(maxlen=ERROR_WINDOW)
+        self.inflight = 0
+        self.down_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.model}@{self.host}"
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def healthy(self, now=None):
+        return (now or time.monotonic()) >= self.down_until
+
+    def expected_wait(self):
+        # Unmeasured backends score 0 so they get tried early
+        return (self.latency or 0.0) * (1 + self.inflight)
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "latency_s": round(self.latency, 3) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "inflight": self.inflight,
+            "healthy": self.healthy(),
+        }
+
+
+class Router:
+    def __init__(self, backends):
+        self.backends = [b if isinstance(b, Backend) else Backend(**b) for b in backends]
+        self._lock = threading.Lock()
+
+    def models(self, task):
+        """Distinct model names that can serve `task`, in configured order."""
+        seen = []
+        for b in self.backends:
+            if task in b.tasks and b.model not in seen:
+                seen.append(b.model)
+        return seen
+
+    def candidates(self, task, model=None):
+        """Backends for `task` (optionally pinned to one model), best first."""
+        pool = [b for b in self.backends
+                if task in b.tasks and (model is None or b.model == model)]
+        if not pool and model is not None:
+            # A pinned model nobody lists for this task: try any host serving it
+            pool = [b for b in self.backends if b.model == model]
+        if not pool:
+            pool = list(self.backends)
+        now = time.monotonic()
+        with self._lock:
+            # Healthy ones first, then by expected wait; list order breaks ties
+            return sorted(pool, key=lambda b: (not b.healthy(now), b.expected_wait()))
+
+    def pick(self, task, model=None):
+        return self.candidates(task, model)[0]
+
+    def record(self, backend, seconds, ok):
+        with self._lock:
+            backend.outcomes.append(ok)
+            if ok:
+                if backend.latency is None:
+                    backend.latency = seconds
+                else:
+                    backend.latency += EWMA_ALPHA * (seconds - backend.latency)
+            elif len(backend.outcomes) >= MIN_SAMPLES and backend.error_rate > MAX_ERROR_RATE:
+                backend.down_until = time.monotonic() + COOLDOWN_SECONDS
+
+    @contextmanager
+    def track(self, backend):
+        """Time a request against `backend` and feed the result back into routing."""
+        with self._lock:
+            backend.inflight += 1
+        start = time.monotonic()
+        try:
+            yield backend
+        except Exception as e:
+            # A request the user cancelled (ollama_client.Cancelled) says nothing
+            # about the backend either
+            if getattr(e, "status", "error") == "error":
+                self.record(backend, time.monotonic() - start, False)
+            raise
+        else:
+            self.record(backend, time.monotonic() - start, True)
+        finally:
+            # A consumer abandoning a stream (GeneratorExit) is not the backend's fault
+            # and records nothing.
+            with self._lock:
+                backend.inflight -= 1
+
+    def stats(self):
+        with self._lock:
+            return [b.stats() for b in self.backends]
+
+
+def classify(text, has_attachment=False):
+    """Map a user message to a task name for routing."""
+    if has_attachment or len(text or "") > SHORT_CHAT_CHARS:
+        return "long"
+    return "chat"
+
+
+def load_backends():
+    raw = os.environ.get("OLLAMA_BACKENDS")
+    if not raw:
+        return DEFAULT_BACKENDS
+    try:
+        backends = json.loads(raw)
+        return backends or DEFAULT_BACKENDS
+    except ValueError:
+        return DEFAULT_BACKENDS
+
+
+# One router per process: Streamlit re-runs the app scripts, not imported modules,
+# so the health numbers survive reruns and are shared by every session.
+router = Router(load_backends())
@@ -0,0 +1,213 @@
+# ocr.py
+"""
+Tesseract helpers shared by the app scripts.
+
+Language auto-detection: instead of OCR-ing every image with a combined pack
+such as eng+hin (every traineddata file is loaded and tried for every image),
+tesseract's orientation-and-script detection (OSD) runs on a downscaled copy
+first and the image is then OCR'd with only the language(s) it contains.
+OSD needs osd.traineddata next to the language packs.
+
+Results are cached per process by image hash and language, so reruns and
+repeated uploads of the same screenshot do not OCR again.
+
+Large images (full notebook pages, whiteboard photos) are cut into horizontal
+bands at blank rows and the bands are OCR'd concurrently. pytesseract runs
+every call as a separate tesseract process, so a thread pool is enough to
+spread the work over all cores. With layout=True the lines are rebuilt from
+word boxes so code keeps its indentation. If tesseract was built with OpenMP,
+set OMP_THREAD_LIMIT=1 so the parallel processes do not oversubscribe.
+"""
+import hashlib
+import io
+import os
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from runtime import lazy_import, tesseract
+
+AUTO = "auto"
+DEFAULT_LANG = "eng"
+
+# OSD script name -> tesseract language pack. OSD only sees the script, so
+# Marathi (also Devanagari) still has to be picked by hand.
+SCRIPT_LANGS = {
+    "Latin": "eng",
+    "Devanagari": "hin",
+    "Tamil": "tam",
+    "Telugu": "tel",
+    "Kannada": "kan",
+    "Malayalam": "mal",
+    "Bengali": "ben",
+    "Gujarati": "guj",
+}
+
+OSD_MAX_SIDE = 1200     # px; OSD is accurate well below screenshot resolution
+OSD_MIN_CONF = 2.0      # tesseract's script_conf below this means "not sure"
+OSD_BANDS = 3           # horizontal strips checked when the whole image is mixed
+
+OCR_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_PIXELS = 2_000_000   # below this one tesseract call is faster than splitting
+MIN_BAND_ROWS = 64                # never cut a band thinner than this
+BLANK_ROW_INK = 1                 # mean ink (0-255) at or below which a row counts as blank
+
+_pool = None
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _osd_image(image):
+    image = image.convert("L")
+    scale = OSD_MAX_SIDE / max(image.size)
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)))
+    return image
+
+
+def _script(image):
+    """(language, confidence) from OSD, or (None, 0.0) if it finds no script."""
+    pytesseract = tesseract()
+    try:
+        osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractError:
+        # Too little text for OSD, or osd.traineddata is not installed
+        return None, 0.0
+    return SCRIPT_LANGS.get(osd.get("script")), float(osd.get("script_conf", 0.0))
+
+
+def detect_langs(image):
+    """Smallest tesseract language string for `image`, e.g. "tam" or "eng+hin".
+
+    One OSD pass on the whole (downscaled) image; only when that is unsure is
+    each horizontal band checked, and the languages found are combined.
+    """
+    small = _osd_image(image)
+    lang, conf = _script(small)
+    if lang and conf >= OSD_MIN_CONF:
+        return lang
+    langs = [lang] if lang else []
+    step = small.height / OSD_BANDS
+    for i in range(OSD_BANDS):
+        band = small.crop((0, round(i * step), small.width, round((i + 1) * step)))
+        band_lang, _ = _script(band)
+        if band_lang and band_lang not in langs:
+            langs.append(band_lang)
+    return "+".join(langs) or DEFAULT_LANG
+
+
+# ------------------------------- #
+# BAND SEGMENTATION AND PARALLEL OCR
+# ------------------------------- #
+def _row_ink(image):
+    """Mean ink per pixel row (0-255), for light or dark backgrounds."""
+    Image = lazy_import("PIL.Image")
+    gray = image.convert("L")
+    light_background = lazy_import("PIL.ImageStat").Stat(gray).mean[0] >= 128
+    ink = gray.point(lambda p: 255 if (p < 128) == light_background else 0)
+    # Shrinking to one column averages every row in C
+    return list(ink.resize((1, gray.height), Image.BOX).getdata())
+
+
+def split_bands(image, parts):
+    """Up to `parts` (top, bottom) row ranges covering the image, cut only
+    through blank rows and as close to equal heights as the gaps allow."""
+    profile = _row_ink(image)
+    height = len(profile)
+    gaps = []
+    start = None
+    for y, ink in enumerate(profile):
+        if ink <= BLANK_ROW_INK:
+            if start is None:
+                start = y
+        elif start is not None:
+            if start:
+                gaps.append((start + y) // 2)
+            start = None
+
+    cuts = [0]
+    for i in range(1, parts):
+        target = height * i / parts
+        usable = [g for g in gaps if cuts[-1] + MIN_BAND_ROWS <= g <= height - MIN_BAND_ROWS]
+        if usable:
+            cut = min(usable, key=lambda g: abs(g - target))
+            if cut > cuts[-1]:
+                cuts.append(cut)
+    cuts.append(height)
+    return list(zip(cuts, cuts[1:]))
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+    return _pool
+
+
+def _layout_lines(data, lines):
+    """Append (left, char width, text) per text line of one image_to_data result."""
+    grouped = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        grouped.setdefault(key, []).append((data["left"][i], data["width"][i], word))
+    # dicts keep tesseract's order, which is reading order
+    for words in grouped.values():
+        words.sort()
+        widths = [w / len(word) for _, w, word in words]
+        lines.append((words[0][0], statistics.median(widths), " ".join(word for _, _, word in words)))
+
+
+def _indent(lines):
+    """Rebuild indentation from each line's left edge, in character widths."""
+    if not lines:
+        return ""
+    base = min(left for left, _, _ in lines)
+    char_width = statistics.median(cw for _, cw, _ in lines) or 1
+    return "\n".join(" " * round((left - base) / char_width) + text for left, _, text in lines)
+
+
+def read(image, lang=None, config="", layout=False):
+    """OCR a PIL image, splitting large ones into bands OCR'd in parallel.
+
+    layout=True rebuilds lines from word boxes and keeps their indentation
+    (for code screenshots); otherwise tesseract's plain text is returned.
+    """
+    pytesseract = tesseract()
+    image.load()    # decode once here, not lazily from several worker threads
+    parts = min(OCR_WORKERS, image.height // MIN_BAND_ROWS)
+    if parts > 1 and image.width * image.height >= PARALLEL_MIN_PIXELS:
+        boxes = split_bands(image, parts)
+    else:
+        boxes = [(0, image.height)]
+
+    def run(box):
+        crop = image if len(boxes) == 1 else image.crop((0, box[0], image.width, box[1]))
+        if layout:
+            return pytesseract.image_to_data(crop, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+        return pytesseract.image_to_string(crop, lang=lang, config=config)
+
+    results = [run(boxes[0])] if len(boxes) == 1 else list(_executor().map(run, boxes))
+    if not layout:
+        return "\n".join(r.strip("\n") for r in results)
+    lines = []
+    for data in results:
+        _layout_lines(data, lines)
+    return _indent(lines)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def image_to_string(key, _data, lang=AUTO):
+    """OCR image bytes; returns (text, language used).
+
+    `key` is digest(_data): the cache is keyed on it and the language rather
+    than on the raw bytes. With lang=AUTO the detected language is cached too.
+    """
+    image = lazy_import("PIL.Image").open(io.BytesIO(_data))
+    if lang == AUTO:
+        lang = detect_langs(image)
+    return read(image, lang=lang).strip(), lang
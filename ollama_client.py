@@ -0,0 +1,311 @@
+# ollama_client.py
+"""
+Thin HTTP client for the Ollama REST API, shared by the chat apps.
+
+Every call names a task ("chat", "long", "code", ...) instead of a model; the
+router in model_router.py decides which host/model serves it. Connection errors
+and HTTP errors fail over to the next candidate backend before giving up.
+Answers come back as ollama_responses.Reply objects, and every call is timed
+through metrics.request. Each request carries the task's generation profile
+(num_predict, stop, temperature, num_ctx; see gen_profiles).
+
+Every call takes an optional CancelToken. Cancelling it closes the HTTP
+response, which makes Ollama stop generating, and the call raises Cancelled.
+Non-streamed calls given a token are streamed internally so they can be
+aborted too. Generation runs a streamed answer in a daemon thread that the
+app polls from its reruns; supersede() cancels a session's previous one:
+
+    job = ollama_client.supersede(st.session_state, "generation",
+                                  lambda cancel: ollama_client.chat_stream(msgs, cancel=cancel))
+    job.text, job.done, job.error, job.stop()
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+import gen_profiles
+import metrics
+from model_router import router
+from ollama_responses import decode_chat, decode_chunk, decode_generate, decode_generate_chunk
+
+MAX_ATTEMPTS = 2
+TIMEOUT = 120                 # seconds for a whole non-streamed answer
+STREAM_TIMEOUT = (5, 300)     # (connect, between chunks) for streamed answers
+
+
+class OllamaError(Exception):
+    """Raised when no backend could serve the request."""
+
+
+class Cancelled(Exception):
+    """Raised when the request's CancelToken was cancelled."""
+
+    # metrics and the router read this: a cancelled request is not a backend failure
+    status = "cancelled"
+
+
+class CancelToken:
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._closers = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="stopped"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            closers, self._closers = self._closers, []
+        for close in closers:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    @contextmanager
+    def closing(self, resource, close=None):
+        """Call `close` (default: resource.close) if cancelled meanwhile."""
+        close = close or resource.close
+        with self._lock:
+            registered = not self._event.is_set()
+            if registered:
+                self._closers.append(close)
+        if not registered:
+            close()
+            raise Cancelled(self.reason)
+        try:
+            yield resource
+        finally:
+            with self._lock:
+                if close in self._closers:
+                    self._closers.remove(close)
+
+
+_sessions = {}
+
+
+def _session(host):
+    # One pooled connection per host instead of a new TCP handshake per call
+    s = _sessions.get(host)
+    if s is None:
+        s = _sessions[host] = requests.Session()
+    return s
+
+
+def _question(payload):
+    if "prompt" in payload:
+        return payload["prompt"]
+    for m in reversed(payload.get("messages") or ()):
+        if m.get("role") == "user":
+            return m.get("content", "")
+    return ""
+
+
+def _options(payload, task, model):
+    """The task's generation profile (see gen_profiles), under the caller's own options."""
+    return {**gen_profiles.options(task, _question(payload), model), **(payload.get("options") or {})}
+
+
+def _post(backend, path, payload, task, stream=False):
+    resp = _session(backend.host).post(
+        f"{backend.host}{path}",
+        json={**payload, "model": backend.model, "stream": stream,
+              "options": _options(payload, task, backend.model)},
+        timeout=STREAM_TIMEOUT if stream else TIMEOUT,
+        stream=stream,
+    )
+    if not resp.ok:
+        raise OllamaError(f"Ollama error {resp.status_code} from {backend.name}: {resp.text}")
+    return resp
+
+
+def _observe(task, payload, reply):
+    # Replies to calls that capped num_predict themselves (research plans and
+    # sub-answers, cascade drafts and verdicts) say nothing about how long
+    # the task's answers need to be, so they do not move its budget
+    if "num_predict" not in (payload.get("options") or {}):
+        gen_profiles.observe(task, reply)
+
+
+def _failure(backend, e):
+    # KeyError/ValueError come from a malformed response (bad JSON, missing
+    # fields); like a failed request they fail over and end as OllamaError
+    if isinstance(e, (requests.RequestException, OllamaError)):
+        return e
+    return OllamaError(f"Malformed response from {backend.name}: {e!r}")
+
+
+def _request(path, payload, task, model, decode):
+    last = None
+    with metrics.request(task) as rec:
+        for backend in router.candidates(task, model)[:MAX_ATTEMPTS]:
+            try:
+                with router.track(backend):
+                    rec.sent(backend)
+                    reply = decode(_post(backend, path, payload, task).json())
+                rec.finish(reply)
+                _observe(task, payload, reply)
+                return reply
+            except (requests.RequestException, OllamaError, KeyError, ValueError) as e:
+                last = _failure(backend, e)
+        raise OllamaError(f"Ollama not reachable: {last}")
+
+
+def _stream(path, payload, task, model, decode, cancel):
+    last = None
+    with metrics.request(task) as rec:
+        for backend in router.candidates(task, model)[:MAX_ATTEMPTS]:
+            if cancel is not None:
+                cancel.check()
+            try:
+                with router.track(backend):
+                    rec.sent(backend)
+                    with _post(backend, path, payload, task, stream=True) as resp:
+                        for chunk in _lines(resp, backend, cancel):
+                            rec.first_token()
+                            reply = decode(chunk)
+                            if reply.done:
+                                rec.finish(reply)
+                                _observe(task, payload, reply)
+                            yield reply
+                return
+            except (requests.RequestException, OllamaError, KeyError, ValueError) as e:
+                if rec.first_token_at is not None:
+                    raise OllamaError(str(_failure(backend, e))) from e
+                last = _failure(backend, e)
+        raise OllamaError(f"Ollama not reachable: {last}")
+
+
+def _lines(resp, backend, cancel):
+    if cancel is None:
+        lines = resp.iter_lines()
+    else:
+        lines = _cancellable(resp, cancel)
+    for line in lines:
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if "error" in chunk:
+            raise OllamaError(f"Ollama error from {backend.name}: {chunk['error']}")
+        yield chunk
+
+
+def _cancellable(resp, cancel):
+    with cancel.closing(resp):
+        try:
+            for line in resp.iter_lines():
+                cancel.check()
+                yield line
+        except Cancelled:
+            raise
+        except Exception:
+            # Closing the response from another thread breaks the read
+            cancel.check()
+            raise
+
+
+def _collect(chunks):
+    """The final Reply of a stream, carrying the whole text."""
+    parts = []
+    reply = None
+    for reply in chunks:
+        parts.append(reply.text)
+    reply.text = "".join(parts)
+    return reply
+
+
+def generate(prompt, task="chat", model=None, cancel=None, **fields):
+    """POST /api/generate without streaming; returns a Reply."""
+    payload = {"prompt": prompt, **fields}
+    if cancel is not None:
+        return _collect(_stream("/api/generate", payload, task, model, decode_generate_chunk, cancel))
+    return _request("/api/generate", payload, task, model, decode_generate)
+
+
+def generate_stream(prompt, task="chat", model=None, cancel=None, **fields):
+    """POST /api/generate with streaming; yields a Reply per chunk (the last has done=True)."""
+    return _stream("/api/generate", {"prompt": prompt, **fields}, task, model, decode_generate_chunk, cancel)
+
+
+def chat(messages, task="chat", model=None, cancel=None, **fields):
+    """POST /api/chat without streaming; returns a Reply."""
+    payload = {"messages": messages, **fields}
+    if cancel is not None:
+        return _collect(_stream("/api/chat", payload, task, model, decode_chunk, cancel))
+    return _request("/api/chat", payload, task, model, decode_chat)
+
+
+def chat_stream(messages, task="chat", model=None, cancel=None, **fields):
+    """POST /api/chat with streaming; yields a Reply per chunk (the last has done=True).
+
+    Fails over to another backend only if nothing has been yielded yet.
+    """
+    return _stream("/api/chat", {"messages": messages, **fields}, task, model, decode_chunk, cancel)
+
+
+# ------------------------------- #
+# BACKGROUND GENERATION
+# ------------------------------- #
+class Generation:
+    """One streamed answer produced by a daemon thread; safe to poll from reruns.
+
+    `start(cancel)` returns the Reply chunks. `info` is kept for the caller
+    (the chat the answer belongs to, the messages it was asked with, ...).
+    """
+
+    def __init__(self, start, **info):
+        self.info = info
+        self.text = ""
+        self.reply = None         # the final chunk (token counts, context)
+        self.done = False
+        self.error = None
+        self.token = CancelToken()
+        self.submitted = time.monotonic()
+        threading.Thread(target=self._run, args=(start,), daemon=True).start()
+
+    def _run(self, start):
+        try:
+            with metrics.queued(self.submitted):
+                for chunk in start(self.token):
+                    self.text += chunk.text
+                    if chunk.done:
+                        self.reply = chunk
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done = True
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def stop(self, reason="stopped"):
+        self.token.cancel(reason)
+
+
+def supersede(state, key, start=None, **info):
+    """Cancel the Generation in state[key]; with `start`, run a new one there.
+
+    `state` is st.session_state (or any mapping). Returns the new Generation,
+    or None.
+    """
+    old = state.get(key)
+    if old is not None and not old.done:
+        old.stop("superseded")
+    state[key] = Generation(start, **info) if start is not None else None
+    return state[key]
@@ -0,0 +1,89 @@
+# ollama_responses.py
+"""
+Typed views of Ollama REST payloads.
+
+There is exactly one decoder per API shape, so callers never probe for keys:
+
+    decode_generate        /api/generate (stream=false)   text in "response"
+    decode_chat            /api/chat     (stream=false)   text in "message.content"
+    decode_chunk           /api/chat     (stream=true)    one line of the stream
+    decode_generate_chunk  /api/generate (stream=true)    one line of the stream
+
+The final payload of every shape carries token counts and durations (in
+nanoseconds); they are copied onto the Reply so throughput comes for free.
+"""
+
+NS = 1e9
+
+
+class Reply:
+    __slots__ = (
+        "text", "model", "done", "done_reason", "context",
+        "prompt_eval_count", "eval_count",
+        "total_duration", "load_duration", "prompt_eval_duration", "eval_duration",
+    )
+
+    def __init__(self, text, model=None, done=False, done_reason=None, context=None,
+                 prompt_eval_count=0, eval_count=0, total_duration=0, load_duration=0,
+                 prompt_eval_duration=0, eval_duration=0):
+        self.text = text
+        self.model = model
+        self.done = done
+        self.done_reason = done_reason
+        self.context = context
+        self.prompt_eval_count = prompt_eval_count
+        self.eval_count = eval_count
+        self.total_duration = total_duration
+        self.load_duration = load_duration
+        self.prompt_eval_duration = prompt_eval_duration
+        self.eval_duration = eval_duration
+
+    @property
+    def tokens_per_second(self):
+        """Generation speed reported by the server (0.0 if unknown)."""
+        return self.eval_count * NS / self.eval_duration if self.eval_duration else 0.0
+
+    @property
+    def prompt_tokens_per_second(self):
+        """Prefill speed reported by the server (0.0 if unknown)."""
+        return self.prompt_eval_count * NS / self.prompt_eval_duration if self.prompt_eval_duration else 0.0
+
+    def __repr__(self):
+        return f"Reply(model={self.model!r}, done={self.done}, eval_count={self.eval_count}, text={self.text[:40]!r})"
+
+
+def _final(text, data):
+    return Reply(
+        text,
+        data.get("model"),
+        True,
+        data.get("done_reason"),
+        data.get("context"),
+        data.get("prompt_eval_count", 0),
+        data.get("eval_count", 0),
+        data.get("total_duration", 0),
+        data.get("load_duration", 0),
+        data.get("prompt_eval_duration", 0),
+        data.get("eval_duration", 0),
+    )
+
+
+def decode_generate(data):
+    return _final(data["response"], data)
+
+
+def decode_chat(data):
+    return _final(data["message"]["content"], data)
+
+
+def decode_chunk(data):
+    # Intermediate chunks carry only a token or two; skip the metric fields
+    if not data["done"]:
+        return Reply(data["message"]["content"], data["model"])
+    return _final(data["message"]["content"], data)
+
+
+def decode_generate_chunk(data):
+    if not data["done"]:
+        return Reply(data["response"], data["model"])
+    return _final(data["response"], data)
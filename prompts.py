@@ -0,0 +1,201 @@
+# prompts.py
+"""
+Prompt templates for kamal.py, built once at import.
+
+    tpl = prompts.get("image_code", intent="fix")
+    tpl.render(user_text=..., intent=..., ocr_text=...)
+    tpl.tokens                      # estimated cost of the fixed text
+    tpl.id                          # "image_code.fix@v2", for logs and A/B comparisons
+
+Template text is dedented and whitespace-minimized when it is registered, so
+source indentation never reaches the model. The fixed instructions come before
+the per-request fields: requests with the same template then share a prompt
+prefix, which Ollama can reuse from its cache.
+
+Bump a template's version whenever its wording changes.
+"""
+import re
+import string
+import textwrap
+
+_BLANK_RUNS = re.compile(r"\n{3,}")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def minimize(text):
+    """Dedent, drop trailing spaces and collapse blank-line runs to one."""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip().splitlines()]
+    return _BLANK_RUNS.sub("\n\n", "\n".join(lines))
+
+
+def estimate_tokens(text):
+    """Rough token count: words and punctuation marks.
+
+    Close enough to compare templates; Ollama's prompt_eval_count (in the
+    metrics records) is the exact figure for a given model.
+    """
+    return len(_TOKEN.findall(text))
+
+
+class PromptTemplate:
+    __slots__ = ("name", "intent", "version", "text", "fields", "tokens")
+
+    def __init__(self, name, version, text, intent=None):
+        self.name = name
+        self.intent = intent
+        self.version = version
+        self.text = minimize(text)
+        self.fields = tuple(f for _, f, _, _ in string.Formatter().parse(self.text) if f)
+        self.tokens = estimate_tokens(self.text.format_map({f: "" for f in self.fields}))
+
+    @property
+    def id(self):
+        variant = f".{self.intent}" if self.intent else ""
+        return f"{self.name}{variant}@v{self.version}"
+
+    def render(self, **values):
+        return self.text.format_map(values)
+
+    def cost(self, **values):
+        """Estimated tokens of the rendered prompt."""
+        return self.tokens + sum(estimate_tokens(str(values[f])) for f in set(self.fields))
+
+
+_registry = {}
+
+
+def register(name, version, text, intent=None):
+    tpl = PromptTemplate(name, version, text, intent)
+    _registry[(name, intent)] = tpl
+    return tpl
+
+
+def get(name, intent=None):
+    """The variant of `name` for `intent`, falling back to the base template."""
+    tpl = _registry.get((name, intent)) or _registry.get((name, None))
+    if tpl is None:
+        raise KeyError(f"No prompt template {name!r}")
+    return tpl
+
+
+def templates():
+    return sorted(_registry.values(), key=lambda t: t.id)
+
+
+# ------------------------------- #
+# TEMPLATES
+# ------------------------------- #
+register("chat_system", 1, """
+    You are CodeGene AI, a helpful programming assistant.
+    Answer clearly and concisely. Put code in fenced blocks labeled with the language.
+""")
+
+register("code_system", 1, """
+    You are CodeGene AI, an expert programming assistant.
+    When a user asks to fix code, you MUST output a fully corrected and runnable version inside triple backticks labeled with the language (e.g., ```python).
+    You MUST fix all logical, syntax, and runtime errors.
+    Do NOT include greetings, intros, or meta text.
+    After the code, give a concise bullet-point explanation of what was fixed.
+    Do NOT repeat the user's code or text.
+""")
+
+# Screenshot that looks like code. The base template lets the model pick the
+# task and serves "explain", the default intent; the others are focused.
+register("image_code", 2, """
+    You are CodeGene AI, a highly skilled AI programmer and code mentor.
+    The text below was extracted from an image with OCR. It may be a code snippet, an assignment, or a programming question. Decide the correct task:
+    1. If the code is complete and correct, explain what it does line by line, its logic, and its output.
+    2. If the code has syntax or logic errors, fix it fully and show the corrected version in a ```python block, then explain what was wrong and how you fixed it.
+    3. If the text asks for code (e.g., "write a function that..."), write a complete, efficient, and readable solution using best practices, then explain it in detail.
+    Always give a clear final explanation after any code, and never skip showing the corrected or written code in a ```python block.
+
+    User message: {user_text}
+    Detected intent: {intent}
+    Extracted text:
+    {ocr_text}
+""")
+
+register("image_code", 2, """
+    You are CodeGene AI, a highly skilled AI programmer and code mentor.
+    The text below was extracted from an image with OCR and the user wants it fixed.
+    Fix every syntax, logic, and runtime error and show the complete corrected code in a ```python block. Then explain what was wrong and how you fixed it.
+
+    User message: {user_text}
+    Detected intent: {intent}
+    Extracted text:
+    {ocr_text}
+""", intent="fix")
+
+register("image_code", 2, """
+    You are CodeGene AI, a highly skilled AI programmer and code mentor.
+    The text below was extracted from an image with OCR and the user wants code written for it.
+    Write a complete, efficient, and readable solution using best practices in a ```python block, then explain it in detail.
+
+    User message: {user_text}
+    Detected intent: {intent}
+    Extracted text:
+    {ocr_text}
+""", intent="write")
+
+register("image_code", 2, """
+    You are CodeGene AI, a highly skilled AI programmer and code mentor.
+    The text below was extracted from an image with OCR and the user wants the code improved.
+    Rewrite it to be faster and cleaner without changing its behavior and show the result in a ```python block. Then list the improvements.
+
+    User message: {user_text}
+    Detected intent: {intent}
+    Extracted text:
+    {ocr_text}
+""", intent="optimize")
+
+# Screenshot that does not look like code
+register("image_text", 2, """
+    You are CodeGene AI, a helpful assistant.
+    Decide whether the text extracted from the user's image is code (Python, Java, JS, etc.), a question about code, or a general query.
+    If it is code: correct and explain it if broken, explain it line by line if correct, and give rewritten or optimized code if the user asks to "improve" or "optimize".
+    If it is not code: answer clearly and precisely in human language.
+    Always include a ```python block when returning code, a bulleted or numbered explanation, and a concise summary at the end.
+
+    Image: {img_name}
+    User message: {user_text}
+    Extracted text:
+    {ocr_text}
+""")
+
+register("pdf_system", 1, "You are CodeGene AI, an expert document summarizer.")
+
+register("pdf_summary", 1, """
+    Summarize the following PDF in concise bullet points:
+
+    {pdf_text}
+""")
+
+register("research_system", 1, "You are a deep research assistant. Provide a detailed, factual, structured answer.")
+
+# Deep Research (research.py): plan, one answer per sub-question, merge
+register("research_plan", 1, """
+    Break the research question below into at most {max_questions} focused sub-questions that together cover it.
+    Output only the sub-questions, one per line, without numbering or any other text.
+
+    Question: {query}
+""")
+
+register("research_sub", 1, """
+    Answer one sub-question of a larger research question. Be factual and concise; say so if something is uncertain.
+
+    Research question: {query}
+    Sub-question: {question}
+    {sources}
+""")
+
+register("research_merge", 2, """
+    Write a detailed, well-structured answer to the research question from the findings below.
+    Combine overlapping points, resolve contradictions, keep document citations such as [2] exactly as numbered, and do not mention the sub-questions.
+
+    Research question: {query}
+
+    Findings:
+    {findings}
+
+    {sources}
+""")
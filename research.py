@@ -0,0 +1,216 @@
+# research.py
+"""
+Deep Research for kamal.py: plan, research sub-questions in parallel, merge.
+
+    job = research.Research(query, model="llama2", documents=[{"name": ..., "digest": ...}])
+    job.status, job.questions, job.answers, job.text, job.done, job.error, job.stop()
+
+1. plan      the model splits the query into up to MAX_QUESTIONS sub-questions
+2. research  each sub-question is answered on its own (SUB_TOKENS max), at most
+             CONCURRENCY at a time; the router spreads them over the backends.
+             With documents, each answer is grounded in the best-matching
+             chunks of the user's uploaded PDFs (doc_cache "pdf_chunks")
+3. merge     the findings are merged into one answer, streamed into job.text
+
+The sub-answers run concurrently, so a research run takes about as long as
+the slowest sub-answer plus the merge, not the sum of all of them. Plans,
+sub-answers and merged answers are cached in doc_cache, keyed by the prompt
+template versions, model, question and grounding, so rerunning a query (or a
+query sharing sub-questions) reuses them. Like ollama_client.Generation, the
+job runs in a daemon thread and the page polls it.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import doc_cache
+import metrics
+import ollama_client
+import prompts
+
+MAX_QUESTIONS = 4
+CONCURRENCY = int(os.environ.get("RESEARCH_CONCURRENCY", "3"))
+SUB_TOKENS = 384
+PLAN_TOKENS = 160
+TOP_CHUNKS = 3
+EXCERPT_CHARS = 1200
+
+_WORD = re.compile(r"[a-z0-9]{3,}")
+_LIST_MARK = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+STOPWORDS = frozenset(
+    "the and for are but not you all any can had her was one our out has have how its may new now "
+    "see two way who did get let say she too use what when where which why with this that from "
+    "they them then than will would there their about into more some such does".split()
+)
+
+
+def _terms(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+# ------------------------------- #
+# DOCUMENT GROUNDING
+# ------------------------------- #
+def load_chunks(documents):
+    """[(document name, chunk text)] for the documents' cached PDF chunks."""
+    chunks = []
+    for doc in documents:
+        for _offset, text in doc_cache.get(doc["digest"], "pdf_chunks") or ():
+            chunks.append((doc["name"], text))
+    return chunks
+
+
+def retrieve(question, chunks, k=TOP_CHUNKS):
+    """The k chunks that best match `question` (TF-IDF over the chunks)."""
+    query = set(_terms(question))
+    if not query or not chunks:
+        return []
+    counts = [Counter(_terms(text)) for _, text in chunks]
+    df = Counter(term for c in counts for term in query if term in c)
+    n = len(chunks)
+    scored = []
+    for i, c in enumerate(counts):
+        score = sum(math.log(1 + c[t]) * math.log(1 + n / df[t]) for t in query if c[t])
+        if score:
+            scored.append((score, i))
+    scored.sort(reverse=True)
+    return [chunks[i] for _, i in scored[:k]]
+
+
+def number_excerpts(questions, chunks):
+    """{question: [(n, name, text)]} with one numbering for the whole run.
+
+    An excerpt keeps its number in every sub-answer, so a citation [n]
+    means the same excerpt wherever it ends up in the merged answer.
+    """
+    numbers = {}
+    refs = {}
+    for q in questions:
+        refs[q] = [(numbers.setdefault(chunk, len(numbers) + 1),) + chunk for chunk in retrieve(q, chunks)]
+    return refs
+
+
+def _sources(refs):
+    if not refs:
+        return ""
+    lines = ["Excerpts from the user's documents (cite by their numbers, e.g. [2], when used):"]
+    for n, name, text in refs:
+        lines.append(f"[{n}] {name}: {text[:EXCERPT_CHARS]}")
+    return "\n".join(lines)
+
+
+def _source_list(sources):
+    if not sources:
+        return ""
+    return "Cited excerpts:\n" + "\n".join(f"[{n}] {name}" for n, name in sources)
+
+
+# ------------------------------- #
+# PIPELINE
+# ------------------------------- #
+def parse_plan(text, query):
+    questions = []
+    for line in text.splitlines():
+        q = _LIST_MARK.sub("", line).strip()
+        # "Here are the sub-questions:" and similar preambles are not questions
+        if len(q) > 10 and not q.endswith(":") and q not in questions:
+            questions.append(q)
+    return questions[:MAX_QUESTIONS] or [query]
+
+
+class Research:
+    def __init__(self, query, model=None, documents=(), concurrency=CONCURRENCY):
+        self.query = query
+        self.model = model
+        self.documents = list(documents)
+        self.concurrency = concurrency
+        self.status = "planning"
+        self.questions = []
+        self.answers = {}          # sub-question -> answer (None if it failed)
+        self.sources = []          # [(n, document name)] for the [n] citations
+        self.text = ""
+        self.done = False
+        self.error = None
+        self.token = ollama_client.CancelToken()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.token.cancel()
+
+    def _ask(self, system, user, task, **options):
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        reply = ollama_client.chat(messages, task=task, model=self.model, cancel=self.token, options=options)
+        return reply.text.strip()
+
+    def _plan(self):
+        tpl = prompts.get("research_plan")
+        key = doc_cache.key(tpl.id, self.model, self.query)
+        text = doc_cache.get_or_compute(key, "research-plan", lambda: self._ask(
+            prompts.get("research_system").render(),
+            tpl.render(query=self.query, max_questions=MAX_QUESTIONS),
+            "research", num_predict=PLAN_TOKENS,
+        ))
+        return parse_plan(text, self.query)
+
+    def _answer(self, question, refs, submitted):
+        with metrics.queued(submitted):    # sub-questions wait for a pool slot
+            return self._answer_now(question, refs)
+
+    def _answer_now(self, question, refs):
+        tpl = prompts.get("research_sub")
+        sources = _sources(refs)
+        key = doc_cache.key(tpl.id, self.model, self.query, question, sources)
+        return doc_cache.get_or_compute(key, "research-sub", lambda: self._ask(
+            prompts.get("research_system").render(),
+            tpl.render(query=self.query, question=question, sources=sources),
+            "research", num_predict=SUB_TOKENS,
+        ))
+
+    def _merge(self):
+        tpl = prompts.get("research_merge")
+        findings = "\n\n".join(f"### {q}\n{self.answers[q]}" for q in self.questions if self.answers.get(q))
+        sources = _source_list(self.sources)
+        key = doc_cache.key(tpl.id, self.model, self.query, findings, sources)
+        cached = doc_cache.get(key, "research-merged") if doc_cache.ENABLED else None
+        if cached is not None:
+            self.text = cached
+            return
+        messages = [
+            {"role": "system", "content": prompts.get("research_system").render()},
+            {"role": "user", "content": tpl.render(query=self.query, findings=findings, sources=sources)},
+        ]
+        for chunk in ollama_client.chat_stream(messages, task="research", model=self.model, cancel=self.token):
+            self.text += chunk.text
+        if doc_cache.ENABLED:
+            doc_cache.put(key, "research-merged", self.text)
+
+    def _run(self):
+        try:
+            with metrics.stage("research"):
+                self.questions = self._plan()
+                self.status = "researching"
+                refs = number_excerpts(self.questions, load_chunks(self.documents))
+                self.sources = sorted({(n, name) for r in refs.values() for n, name, _ in r})
+                with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+                    futures = {pool.submit(self._answer, q, refs[q], time.monotonic()): q for q in self.questions}
+                    for future in as_completed(futures):
+                        try:
+                            self.answers[futures[future]] = future.result()
+                        except ollama_client.OllamaError:
+                            self.answers[futures[future]] = None
+                if not any(self.answers.values()):
+                    raise ollama_client.OllamaError("every sub-question failed")
+                self.status = "merging"
+                self._merge()
+                self.status = "done"
+        except ollama_client.Cancelled:
+            self.status = "stopped"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.done = True
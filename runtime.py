@@ -0,0 +1,66 @@
+# runtime.py
+"""
+Process-wide helpers for the app scripts.
+
+Streamlit re-executes an app script top to bottom on every interaction, but
+imported modules and st.cache_resource values live as long as the server
+process. Anything expensive that does not depend on the session belongs here,
+so that an idle rerun costs next to nothing.
+
+The Ollama HTTP sessions and the model router are plain module-level
+singletons in ollama_client.py / model_router.py (they are also used outside
+Streamlit by the benchmarks).
+"""
+import importlib
+import os
+import sys
+
+import streamlit as st
+
+import metrics
+
+
+def lazy_import(name):
+    """Import `name` on first use and record how long the import took.
+
+    Heavy optional modules (pandas, PyPDF2, speech_recognition, ...) are only
+    paid for by the pages and actions that need them.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        with metrics.stage("import", module=name):
+            module = importlib.import_module(name)
+    return module
+
+
+WINDOWS_TESSERACT = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+
+@st.cache_resource
+def tesseract():
+    """pytesseract, configured once per process.
+
+    TESSERACT_CMD overrides the binary; otherwise the default Windows install
+    path is used when it exists and PATH lookup everywhere else.
+    """
+    pytesseract = lazy_import("pytesseract")
+    cmd = os.environ.get("TESSERACT_CMD")
+    if not cmd and os.path.exists(WINDOWS_TESSERACT):
+        cmd = WINDOWS_TESSERACT
+    if cmd:
+        pytesseract.pytesseract.tesseract_cmd = cmd
+    return pytesseract
+
+
+@st.cache_resource
+def ensure_dir(path):
+    """Create `path` once per process instead of on every rerun."""
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@st.cache_resource
+def read_text(path):
+    """File contents read once per process (stylesheets, templates)."""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,199 @@
+# serve.py
+"""
+Multi-process deployment: several Streamlit workers of one app behind a sticky
+reverse proxy, so one box serves the app on all of its cores.
+
+    python serve.py kamal --workers 4 --port 8501
+
+Workers listen on 127.0.0.1 (--worker-port, --worker-port + 1, ...). The proxy
+passes connections through unchanged (HTTP and Streamlit's WebSocket) and pins
+each browser to one worker with the codegene_worker cookie, because a
+Streamlit session and its in-memory state belong to the process that created
+it. New browsers go to the worker with the fewest open connections; if a
+pinned worker is down, the browser is re-pinned to a live one.
+
+The proxy also gives every browser a codegene_client cookie. Chats are stored
+under that id in the SQLite database all workers share (shared_store.py), and
+extracted documents in the shared doc_cache directory.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+from shared_store import CLIENT_COOKIE
+
+WORKER_COOKIE = "codegene_worker"
+HEAD_LIMIT = 64 * 1024
+PIPE_CHUNK = 64 * 1024
+
+
+def _cookies(head):
+    cookies = {}
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"cookie":
+            for part in value.decode("latin-1").split(";"):
+                k, _, v = part.strip().partition("=")
+                cookies[k] = v
+    return cookies
+
+
+class Proxy:
+    def __init__(self, ports, host="127.0.0.1"):
+        self.host = host
+        self.ports = ports
+        self.active = [0] * len(ports)
+        self.down_until = [0.0] * len(ports)
+
+    def _alive(self, i):
+        return self.down_until[i] <= time.monotonic()
+
+    def _pick(self):
+        live = [i for i in range(len(self.ports)) if self._alive(i)] or list(range(len(self.ports)))
+        return min(live, key=lambda i: self.active[i])
+
+    async def _connect(self, pinned):
+        """(worker index, reader, writer), trying the pinned worker first."""
+        order = [pinned] if pinned is not None and self._alive(pinned) else []
+        order += sorted((i for i in range(len(self.ports)) if i not in order), key=lambda i: self.active[i])
+        for i in order:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.ports[i])
+                return i, reader, writer
+            except OSError:
+                self.down_until[i] = time.monotonic() + 5.0
+        raise OSError("no worker reachable")
+
+    async def handle(self, client_r, client_w):
+        try:
+            head = await client_r.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_w.close()
+            return
+        cookies = _cookies(head)
+        pinned = cookies.get(WORKER_COOKIE)
+        pinned = int(pinned) if pinned and pinned.isdigit() and int(pinned) < len(self.ports) else None
+        try:
+            worker, up_r, up_w = await self._connect(pinned if pinned is not None else self._pick())
+        except OSError:
+            client_w.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await client_w.drain()
+            client_w.close()
+            return
+
+        set_cookies = []
+        if worker != pinned:
+            set_cookies.append(f"{WORKER_COOKIE}={worker}; Path=/; HttpOnly; SameSite=Lax")
+        if CLIENT_COOKIE not in cookies:
+            set_cookies.append(f"{CLIENT_COOKIE}={uuid.uuid4().hex}; Path=/; Max-Age=31536000; HttpOnly; SameSite=Lax")
+
+        self.active[worker] += 1
+        try:
+            up_w.write(head)
+            upstream = asyncio.ensure_future(self._pipe(client_r, up_w))
+            try:
+                resp = await up_r.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                upstream.cancel()
+                return
+            if set_cookies:
+                extra = "".join(f"Set-Cookie: {c}\r\n" for c in set_cookies).encode("latin-1")
+                resp = resp[:-2] + extra + b"\r\n"
+            client_w.write(resp)
+            await asyncio.gather(upstream, self._pipe(up_r, client_w), return_exceptions=True)
+        finally:
+            self.active[worker] -= 1
+            for w in (up_w, client_w):
+                w.close()
+
+    @staticmethod
+    async def _pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(PIPE_CHUNK)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if writer.can_write_eof():
+                try:
+                    writer.write_eof()
+                except OSError:
+                    pass
+
+
+def _wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.25)
+    return False
+
+
+def start_workers(app, count, first_port, extra_args):
+    procs = []
+    for i in range(count):
+        cmd = [sys.executable, "-m", "streamlit", "run", f"{app}.py",
+               "--server.address", "127.0.0.1", "--server.port", str(first_port + i),
+               "--server.headless", "true", *extra_args]
+        procs.append(subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__))))
+    return procs
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("app", choices=["kamal", "srinidhi", "vaidic", "mahesh"])
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8501)
+    ap.add_argument("--worker-port", type=int, default=8600)
+    ap.add_argument("--store", default="codegene-store.sqlite3", help="shared SQLite database for chats")
+    ap.add_argument("streamlit_args", nargs=argparse.REMAINDER, help="passed to every `streamlit run` after --")
+    args = ap.parse_args(argv)
+
+    # Inherited by the workers
+    os.environ.setdefault("CODEGENE_STORE", os.path.abspath(args.store))
+    extra = [a for a in args.streamlit_args if a != "--"]
+    ports = [args.worker_port + i for i in range(args.workers)]
+    procs = start_workers(args.app, args.workers, args.worker_port, extra)
+    try:
+        for port in ports:
+            if not _wait_for_port(port, timeout=60):
+                print(f"worker on port {port} did not start", file=sys.stderr)
+                return 1
+
+        proxy = Proxy(ports)
+
+        async def serve():
+            server = await asyncio.start_server(proxy.handle, args.host, args.port, limit=HEAD_LIMIT)
+            print(f"{args.app}: {args.workers} workers behind http://{args.host}:{args.port}")
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# shared_store.py
+"""
+Chats shared by every Streamlit worker process on the box.
+
+serve.py runs several workers of one app behind a sticky proxy; a browser is
+pinned to one worker, but its chats have to survive a worker restart or a move
+to another worker. They are kept in one SQLite database (WAL mode, so readers
+never block the writer) named by CODEGENE_STORE. Without CODEGENE_STORE, the
+single-process default, every function here is a no-op and chats live only in
+st.session_state as before.
+
+    chats = shared_store.load_chats("kamal")       # on session start
+    shared_store.sync_chats("kamal", chats, only=shared_store.changed(chats))   # end of each run
+
+Chats are filed under the browser's client id: the codegene_client cookie the
+proxy sets, or a per-session id when the app is served directly.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from conversation import json_default
+
+STORE_PATH = os.environ.get("CODEGENE_STORE")
+CLIENT_COOKIE = "codegene_client"
+
+_local = threading.local()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    app TEXT NOT NULL,
+    client TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (app, client, chat_id)
+);
+"""
+
+
+def enabled():
+    return bool(STORE_PATH)
+
+
+def _db():
+    """One connection per thread (sqlite3 connections are not shareable)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(STORE_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def client_id():
+    ss = st.session_state
+    if "_client_id" not in ss:
+        cookies = getattr(getattr(st, "context", None), "cookies", None) or {}
+        ss["_client_id"] = cookies.get(CLIENT_COOKIE) or uuid.uuid4().hex
+    return ss["_client_id"]
+
+
+# ------------------------------- #
+# CHATS
+# ------------------------------- #
+def _digest(data):
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).digest()
+
+
+def load_chats(app):
+    """{chat_id: chat} for this client, in creation order."""
+    if not enabled():
+        return {}
+    rows = _db().execute(
+        "SELECT chat_id, data FROM chats WHERE app = ? AND client = ? ORDER BY rowid",
+        (app, client_id()),
+    ).fetchall()
+    st.session_state["_store_digests"] = {cid: _digest(data) for cid, data in rows}
+    return {cid: json.loads(data) for cid, data in rows}
+
+
+def _mark(value):
+    # Conversations are append-only and their messages immutable, so the
+    # length and the last message object identify the contents
+    if hasattr(value, "snapshot"):
+        return (len(value), value[-1] if value else None)
+    return value
+
+
+def changed(chats):
+    """Ids of the chats whose fields or messages changed since the last call.
+
+    Compares each chat's title and the length and last message of its
+    Conversation, so a rerun that changed nothing (a polling rerun while an
+    answer streams) costs no JSON encoding. Pass the result to sync_chats.
+    """
+    if not enabled():
+        return set()
+    marks = st.session_state.setdefault("_store_marks", {})
+    ids = set()
+    for cid, chat in chats.items():
+        mark = tuple((k, _mark(v)) for k, v in chat.items())
+        if marks.get(cid) != mark:
+            marks[cid] = mark
+            ids.add(cid)
+    for cid in [cid for cid in marks if cid not in chats]:
+        del marks[cid]
+    return ids
+
+
+def sync_chats(app, chats, only=None):
+    """Write the chats that changed since the last sync and drop deleted ones.
+
+    `only` lists the ids that may have changed (changed(), or chat_registry's
+    own tracking); the other chats are not re-serialized.
+    """
+    if not enabled():
+        return
+    known = st.session_state.setdefault("_store_digests", {})
+    changed = []
+    for cid, chat in chats.items():
+        if only is not None and cid not in only and cid in known:
+            continue
+        data = json.dumps(chat, ensure_ascii=False, default=json_default)
+        digest = _digest(data)
+        if known.get(cid) != digest:
+            changed.append((cid, data, digest))
+    removed = [cid for cid in known if cid not in chats]
+    if not changed and not removed:
+        return
+    client = client_id()
+    now = time.time()
+    db = _db()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany(
+            "INSERT INTO chats (app, client, chat_id, data, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (app, client, chat_id) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+            [(app, client, cid, data, now) for cid, data, _ in changed],
+        )
+        db.executemany(
+            "DELETE FROM chats WHERE app = ? AND client = ? AND chat_id = ?",
+            [(app, client, cid) for cid in removed],
+        )
+    for cid, _, digest in changed:
+        known[cid] = digest
+    for cid in removed:
+        del known[cid]
+
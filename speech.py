@@ -0,0 +1,220 @@
+# speech.py
+"""
+Offline speech-to-text for kamal.py's voice input.
+
+Recognition runs in a background thread, so the page keeps rendering while the
+user speaks; the page polls the job for the transcript so far and uses the
+final text as its prompt.
+
+    job = speech.listen(speech.engine())              # server microphone
+    job = speech.transcribe_file(speech.engine(), b)  # uploaded WAV/AIFF/FLAC bytes
+    job.text, job.done, job.error                     # read from any rerun
+
+Engines, tried in this order unless SPEECH_ENGINE names one:
+
+    vosk        VOSK_MODEL=/path/to/vosk-model-small-en-us         partial results while listening
+    whispercpp  WHISPER_CPP_BIN=/path/to/whisper-cli
+                WHISPER_CPP_MODEL=/path/to/ggml-base.en.bin        one result at the end
+    google      speech_recognition's web API (needs network; the old behaviour)
+
+All audio is handed to the engines as 16 kHz mono 16-bit PCM. Microphone
+capture ends PAUSE_SECONDS after the user stops talking (energy below the
+ambient-calibrated threshold, as recognizer.listen did), at LISTEN_SECONDS at
+the latest, or on Stop.
+"""
+import io
+import json
+import math
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from array import array
+
+import streamlit as st
+
+import metrics
+from runtime import lazy_import
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+CHUNK_BYTES = 8000        # 0.25 s of audio per engine call
+LISTEN_SECONDS = 10       # longest capture, the old recognizer.listen phrase limit
+PAUSE_SECONDS = float(os.environ.get("SPEECH_PAUSE_SECONDS", "0.8"))   # silence that ends a phrase
+CALIBRATE_SECONDS = 0.3   # ambient noise sampled to set the speech energy threshold
+
+
+class VoskEngine:
+    name = "vosk"
+
+    def __init__(self, model_path):
+        vosk = lazy_import("vosk")
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self._model = vosk.Model(model_path)   # loaded once per process
+
+    def transcribe(self, chunks):
+        """Yield (transcript so far, final) after every chunk."""
+        rec = self._vosk.KaldiRecognizer(self._model, SAMPLE_RATE)
+        utterances = []
+        for chunk in chunks:
+            if rec.AcceptWaveform(chunk):
+                text = json.loads(rec.Result()).get("text", "")
+                if text:
+                    utterances.append(text)
+                yield " ".join(utterances), False
+            else:
+                partial = json.loads(rec.PartialResult()).get("partial", "")
+                yield " ".join(utterances + [partial] if partial else utterances), False
+        text = json.loads(rec.FinalResult()).get("text", "")
+        if text:
+            utterances.append(text)
+        yield " ".join(utterances), True
+
+
+class WhisperCppEngine:
+    name = "whispercpp"
+
+    def __init__(self, binary, model_path):
+        self.binary = binary
+        self.model_path = model_path
+
+    def transcribe(self, chunks):
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        try:
+            with os.fdopen(fd, "wb") as f, wave.open(f, "wb") as w:
+                w.setnchannels(1)
+                w.setsampwidth(SAMPLE_WIDTH)
+                w.setframerate(SAMPLE_RATE)
+                for chunk in chunks:
+                    w.writeframes(chunk)
+            proc = subprocess.run(
+                [self.binary, "-m", self.model_path, "-f", path, "-nt", "-np"],
+                capture_output=True, text=True,
+            )
+        finally:
+            os.remove(path)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip() or f"whisper.cpp exited with {proc.returncode}")
+        yield " ".join(proc.stdout.split()), True
+
+
+class GoogleEngine:
+    name = "google"
+
+    def transcribe(self, chunks):
+        sr = lazy_import("speech_recognition")
+        audio = sr.AudioData(b"".join(chunks), SAMPLE_RATE, SAMPLE_WIDTH)
+        try:
+            text = sr.Recognizer().recognize_google(audio)
+        except sr.UnknownValueError:
+            text = ""
+        except sr.RequestError as e:
+            raise RuntimeError(f"Speech recognition service unavailable: {e}") from e
+        yield text, True
+
+
+def _available():
+    """Engine name -> factory for every engine configured on this machine."""
+    engines = {}
+    model = os.environ.get("VOSK_MODEL")
+    if model and os.path.isdir(model):
+        engines["vosk"] = lambda: VoskEngine(model)
+    binary, ggml = os.environ.get("WHISPER_CPP_BIN"), os.environ.get("WHISPER_CPP_MODEL")
+    if binary and ggml and os.path.exists(binary) and os.path.exists(ggml):
+        engines["whispercpp"] = lambda: WhisperCppEngine(binary, ggml)
+    engines["google"] = GoogleEngine
+    return engines
+
+
+@st.cache_resource
+def engine():
+    """The speech engine for this process (SPEECH_ENGINE, else the first available)."""
+    engines = _available()
+    wanted = os.environ.get("SPEECH_ENGINE")
+    if wanted:
+        if wanted not in engines:
+            raise RuntimeError(f"Speech engine {wanted!r} is not configured")
+        return engines[wanted]()
+    for name, factory in engines.items():
+        try:
+            return factory()
+        except ImportError:
+            continue
+    raise RuntimeError("No speech engine available")
+
+
+# ------------------------------- #
+# AUDIO SOURCES (16 kHz mono PCM chunks)
+# ------------------------------- #
+def _rms(chunk):
+    samples = array("h", chunk[:len(chunk) - len(chunk) % SAMPLE_WIDTH])
+    return math.sqrt(sum(x * x for x in samples) / len(samples)) if samples else 0.0
+
+
+def microphone_chunks(stop, seconds=LISTEN_SECONDS, pause=PAUSE_SECONDS):
+    """Read the server microphone until the speaker pauses, `stop` is set or `seconds` have passed."""
+    sr = lazy_import("speech_recognition")
+    deadline = time.monotonic() + seconds
+    recognizer = sr.Recognizer()
+    with sr.Microphone(sample_rate=SAMPLE_RATE) as source:
+        recognizer.adjust_for_ambient_noise(source, duration=CALIBRATE_SECONDS)
+        chunk_seconds = source.CHUNK / SAMPLE_RATE
+        heard, quiet = False, 0.0
+        while time.monotonic() < deadline and not stop.is_set():
+            chunk = source.stream.read(source.CHUNK)
+            yield chunk
+            if _rms(chunk) > recognizer.energy_threshold:
+                heard, quiet = True, 0.0
+            elif heard:
+                quiet += chunk_seconds
+                if quiet >= pause:
+                    return
+
+
+def file_chunks(data):
+    """Decode an uploaded WAV/AIFF/FLAC file and convert it to 16 kHz mono PCM."""
+    sr = lazy_import("speech_recognition")
+    with sr.AudioFile(io.BytesIO(data)) as source:
+        audio = sr.Recognizer().record(source)
+    pcm = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=SAMPLE_WIDTH)
+    return [pcm[i:i + CHUNK_BYTES] for i in range(0, len(pcm), CHUNK_BYTES)]
+
+
+# ------------------------------- #
+# BACKGROUND JOBS
+# ------------------------------- #
+class Transcription:
+    """One recognition running in a daemon thread; safe to poll from reruns."""
+
+    def __init__(self, engine, source):
+        self.engine = engine
+        self.text = ""
+        self.done = False
+        self.error = None
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(source,), daemon=True).start()
+
+    def _run(self, source):
+        try:
+            with metrics.stage("speech", engine=self.engine.name):
+                for text, _final in self.engine.transcribe(source(self._stop)):
+                    self.text = text
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done = True
+
+    def stop(self):
+        """Stop listening; the engine still finishes what it has heard."""
+        self._stop.set()
+
+
+def listen(engine, seconds=LISTEN_SECONDS):
+    return Transcription(engine, lambda stop: microphone_chunks(stop, seconds))
+
+
+def transcribe_file(engine, data):
+    return Transcription(engine, lambda stop: file_chunks(data))
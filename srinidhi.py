@@ -1,34 +1,31 @@
 #app.py
-import os, json, asyncio 
+import os, json, asyncio, time 
 from datetime import datetime 
 import streamlit as st 
-import ollama 
-from httpx import ConnectError 
-from PIL import Image 
-import pytesseract 
 import fitz  # PyMuPDF 
+import archive 
+import cascade 
+import doc_cache 
+import metrics 
+import ollama_client 
+import uploads 
+from model_router import classify 
+from runtime import ensure_dir, tesseract 
  
 # ----------------- CONFIG ----------------- 
 st.set_page_config(page_title="Chatbot", page_icon="") 
 HISTORY_DIR = "history" 
-MODEL = "tinyllama" 
 MAX_KEEP = 10 
+KEEP_ALIVE = "30m"  # keep the model (and its prompt cache) loaded between turns 
 MAX_NAME = 20 
 USER, BOT = "user", "assistant" 
-os.makedirs(HISTORY_DIR, exist_ok=True) 
- 
-# Optional: set Tesseract path on Windows (safe no-op elsewhere) 
-try: 
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract
-OCR\tesseract.exe" 
-except Exception: 
-    pass 
+ensure_dir(HISTORY_DIR)  # once per process, not per rerun 
+# Tesseract path (Windows default / TESSERACT_CMD) is set once in runtime.tesseract() 
  
 # ----------------- STATE ----------------- 
 def ensure_state(): 
     ss = st.session_state 
-    ss.setdefault("session_name", f"New Chat {datetime.now().strftime('%H
-%M')}") 
+    ss.setdefault("session_name", f"New Chat {datetime.now().strftime('%H-%M')}") 
     ss.setdefault("messages", []) 
     ss.setdefault("first_message", True) 
     ss.setdefault("rename_target", None) 
@@ -36,6 +33,8 @@ def ensure_state():
     ss.setdefault("file", None) 
     ss.setdefault("input_text", "") 
     ss.setdefault("context_used", False) 
+    ss.setdefault("sent_messages", [])  # exactly what the model has seen, in order 
+    ss.setdefault("generation", None)  # ollama_client.Generation while answering 
  
 ensure_state() 
  
@@ -56,7 +55,9 @@ def load_session(name: str):
         with open(path, "r", encoding="utf-8") as f: 
 
  
-            return json.load(f) 
+            data = json.load(f) 
+        # chats unpacked with `archive.py import` are {"messages": [...], ...} 
+        return data["messages"] if isinstance(data, dict) else data 
     except Exception: 
         return [] 
  
@@ -64,34 +65,57 @@ def save_session(name: str, messages):
     path = os.path.join(HISTORY_DIR, f"{name}.json") 
     try: 
         with open(path, "w", encoding="utf-8") as f: 
-            json.dump(messages, f, indent=2, ensure_ascii=False) 
+            json.dump(messages, f, ensure_ascii=False, separators=(",", ":")) 
         st.cache_data.clear() 
     except Exception as e: 
         st.error(f"Save error: {e}") 
  
 def sanitize_name(s: str) -> str: 
-    s2 = "".join(c for c in s if c.isalnum() or c in (" ", "_", "
-")).strip()[:MAX_NAME] 
+    s2 = "".join(c for c in s if c.isalnum() or c in (" ", "_", "-")).strip()[:MAX_NAME] 
     return s2 or "Untitled" 
  
+# ----------------- ARCHIVES ----------------- 
+def archived_chats(): 
+    # one chat file read at a time while the archive is written 
+    for name in list_sessions(): 
+        yield {"id": name, "title": name, "messages": load_session(name)} 
+ 
+def import_chat(chat): 
+    base = sanitize_name(archive.title_of(chat)) 
+    name, n = base, 2 
+    while os.path.exists(os.path.join(HISTORY_DIR, f"{name}.json")): 
+        name, n = f"{base} {n}", n + 1 
+    messages = chat.get("messages") or [] 
+    save_session(name, [{"role": m["role"], "content": m["content"]} for m in messages]) 
+ 
 # ----------------- OCR/EXTRACT ----------------- 
+# Results are shared across sessions and worker processes by file hash (doc_cache) 
 def extract_from_pdf(file) -> str: 
     try: 
-        text = "" 
-        with fitz.open(stream=file.read(), filetype="pdf") as doc: 
-            for p in doc: 
-                text += p.get_text() 
-        return text.strip() 
+        upload = uploads.wrap(file) 
+        return doc_cache.get_or_compute(upload.digest(), "pdf_text_mupdf", lambda: _pdf_text(upload)) 
     except Exception as e: 
         return f"" 
  
+def _pdf_text(upload) -> str: 
+    text = "" 
+    with metrics.stage("pdf_extract", file=upload.name), \
+            fitz.open(upload.path, filetype="pdf") as doc: 
+        for p in doc: 
+            text += p.get_text() 
+    return text.strip() 
+ 
 def extract_from_image(file) -> str: 
     try: 
-        img = Image.open(file) 
-        return pytesseract.image_to_string(img).strip() 
+        upload = uploads.wrap(file) 
+        return doc_cache.get_or_compute(upload.digest(), "ocr_text", lambda: _image_text(upload)) 
     except Exception: 
         return "" 
  
+def _image_text(upload) -> str: 
+    with metrics.stage("ocr", file=upload.name): 
+        return tesseract().image_to_string(upload.image()).strip() 
+ 
 def get_context_once() -> str: 
     ss = st.session_state 
     if not ss.file or ss.context_used: 
@@ -106,19 +130,19 @@ def get_context_once() -> str:
     return ctx 
  
 # ----------------- MODEL ----------------- 
-def stream_reply(messages): 
-    try: 
-        for chunk in ollama.chat(model=MODEL, messages=messages[
-MAX_KEEP:], stream=True): 
-            yield chunk["message"]["content"] 
-    except ConnectError as e: 
-        st.error(f"Ollama not reachable: {e}") 
-        yield "" 
-    except ollama.ResponseError as e: 
-        st.error(f"Ollama error: {e.error}") 
-        yield "" 
- 
- 
+def window(messages): 
+    """Last MAX_KEEP messages, trimmed in whole steps so the prefix sent to 
+    Ollama stays identical for several turns and its prompt cache is reused.""" 
+    extra = len(messages) - MAX_KEEP 
+    if extra <= 0: 
+        return messages 
+    step = max(2, MAX_KEEP // 4 * 2) 
+    return messages[-(-extra // step) * step:] 
+ 
+def model_stream(messages, task="chat", cancel=None): 
+    # Short questions try the small model first (see cascade) 
+    return cascade.chat_stream("srinidhi", window(messages), task=task, 
+                               keep_alive=KEEP_ALIVE, cancel=cancel) 
  
 # ----------------- ACTIONS ----------------- 
 def on_send(): 
@@ -126,6 +150,8 @@ def on_send():
     prompt = ss.input_text.strip() 
     if not prompt: 
         return 
+    # Sending again while an answer is still streaming stops it; its partial text is kept 
+    stop_generation() 
     # Title from first user message 
     if ss.first_message: 
         ss.session_name = sanitize_name(prompt) 
@@ -133,30 +159,40 @@ def on_send():
  
     # Build contextualized last message if file context available once 
     ctx = get_context_once() 
-    final = (f"You are an assistant that answers based on the provided 
-context. " 
+    final = (f"You are an assistant that answers based on the provided context. " 
              f"Do not repeat the context; only answer the question.\n\n" 
-             f"CONTEXT:\n---\n{ctx}\n---\n\nQUESTION: {prompt}") if ctx 
-else prompt 
+             f"CONTEXT:\n---\n{ctx}\n---\n\nQUESTION: {prompt}") if ctx else prompt 
  
-    # Append user, call model with modified last content 
+    # Append user, call model with modified last content. The model-side history 
+    # keeps the contextualized turn so later requests share the same prefix. 
     ss.messages.append({"role": USER, "content": prompt}) 
-    tmp = ss.messages[:-1] + [{"role": USER, "content": final}] 
+    tmp = ss.sent_messages + [{"role": USER, "content": final}] 
+    task = classify(prompt, has_attachment=bool(ctx)) 
  
-    full = "" 
-    with st.spinner("Thinking..."): 
-        for piece in stream_reply(tmp): 
-            full += piece 
+    # Answered in the background (polled below) so Stop and the next send can cancel it 
+    ss.generation = ollama_client.Generation(lambda cancel: model_stream(tmp, task, cancel), 
+                                             sent=tmp) 
+    ss.input_text = "" 
  
-    if full: 
-        ss.messages.append({"role": BOT, "content": full}) 
+def finish_generation(job): 
+    ss = st.session_state 
+    ss.generation = None 
+    if job.error: 
+        st.error(job.error) 
+    if job.text: 
+        ss.messages.append({"role": BOT, "content": job.text}) 
+        ss.sent_messages = job.info["sent"] + [{"role": BOT, "content": job.text}] 
         save_session(ss.session_name, ss.messages) 
  
-    ss.input_text = "" 
+def stop_generation(): 
+    job = st.session_state.generation 
+    if job is not None: 
+        job.stop() 
+        finish_generation(job) 
  
 def on_new_chat(): 
-    st.session_state.session_name = f"New Chat 
-{datetime.now().strftime('%H-%M')}" 
+    stop_generation() 
+    st.session_state.session_name = f"New Chat {datetime.now().strftime('%H-%M')}" 
     st.session_state.messages = [] 
     st.session_state.first_message = True 
     st.session_state.rename_target = None 
@@ -164,10 +200,13 @@ def on_new_chat():
     st.session_state.file = None 
     st.session_state.input_text = "" 
     st.session_state.context_used = False 
+    st.session_state.sent_messages = [] 
  
 def on_choose_session(name: str): 
+    stop_generation() 
     st.session_state.session_name = name 
     st.session_state.messages = load_session(name) 
+    st.session_state.sent_messages = list(st.session_state.messages) 
     st.session_state.first_message = False 
     st.session_state.rename_target = None 
     st.session_state.file = None 
@@ -202,7 +241,8 @@ def on_rename(old: str, new: str):
  
 def on_file_upload(): 
     if st.session_state.uploader: 
-        st.session_state.file = st.session_state.uploader 
+        # spooled once; extraction and the preview read the same mapped file 
+        st.session_state.file = uploads.Upload(st.session_state.uploader) 
         st.session_state.context_used = False 
  
 def on_clear_file(): 
@@ -264,21 +304,35 @@ st.session_state.menu_open}
                     st.session_state.rename_target = None 
                     st.rerun() 
  
+archive.render_sidebar("srinidhi", archived_chats, import_chat) 
+metrics.render_debug_panel() 
+ 
 st.subheader(f"Current Chat: {st.session_state.session_name}") 
  
 for m in st.session_state.messages: 
     with st.chat_message(m["role"]): 
         st.markdown(m["content"]) 
  
+job = st.session_state.generation 
+if job is not None and job.done: 
+    finish_generation(job) 
+    with st.chat_message(BOT): 
+        st.markdown(job.text) 
+elif job is not None: 
+    with st.chat_message(BOT): 
+        st.markdown(job.text + "▌" if job.text else "Thinking...") 
+        if st.button("⏹ Stop", key="stop_generation"): 
+            stop_generation() 
+            st.rerun() 
+ 
 if st.session_state.file: 
     with st.container(): 
         colA, colB = st.columns([0.85, 0.15]) 
         with colA: 
             if getattr(st.session_state.file, "type", 
 "").startswith("image/"): 
-                st.image(st.session_state.file, caption="Image attached") 
-            elif getattr(st.session_state.file, "type", "") == 
-"application/pdf": 
+                st.image(st.session_state.file.path, caption="Image attached") 
+            elif getattr(st.session_state.file, "type", "") == "application/pdf": 
                 st.info(f" PDF attached: `{st.session_state.file.name}`") 
         with colB: 
             st.button("Clear", use_container_width=True, 
@@ -302,3 +356,8 @@ with box:
 label_visibility="collapsed") 
     with send: 
         st.button("➤", use_container_width=True, on_click=on_send) 
+ 
+# Poll the background answer until it is done 
+if st.session_state.generation is not None: 
+    time.sleep(0.3) 
+    st.rerun() 
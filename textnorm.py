@@ -0,0 +1,76 @@
+# textnorm.py
+"""
+OCR text normalization and code detection.
+
+Everything here runs in C-level string methods with at most one regex pass:
+character fixes are str.replace calls (each returns at once when the character
+is absent; str.translate with a mapping table does a dict lookup per character
+and is far slower on text containing any non-ASCII), and line cleanup is
+split/strip/join instead of multiline regex substitutions.
+"""
+import re
+
+# Typographic characters OCR produces for code punctuation
+_QUOTES = (("‘", "'"), ("’", "'"), ("“", '"'), ("”", '"'))
+
+# Light cleanup straight after tesseract (non-ASCII text is kept)
+OCR_FIXES = _QUOTES + (("•", "-"), ("\t", "    "))
+
+# Code cleanup: ASCII fixes, then drop anything outside printable ASCII
+CODE_FIXES = _QUOTES + (("—", "-"), ("•", "-"), ("´", "'"))
+_NON_ASCII = re.compile(r"[^\x09\x0A\x0D\x20-\x7E]+")
+
+
+def _replace_all(text, fixes):
+    for old, new in fixes:
+        text = text.replace(old, new)
+    return text
+
+
+def normalize_ocr(text):
+    """Quotes/bullets to ASCII and tabs to 4 spaces."""
+    return _replace_all(text, OCR_FIXES)
+
+
+def clean_code(text, keep_indent=False):
+    """Normalize OCR output to cleaner code format: ASCII only, no blank lines
+    or trailing whitespace, and no indentation unless keep_indent is set (for
+    text whose indentation was rebuilt from the layout, see ocr.read)."""
+    lines = _replace_all(text, CODE_FIXES).split("\n")
+    if keep_indent:
+        lines = [line.rstrip() for line in lines]
+        return _NON_ASCII.sub("", "\n".join(filter(None, lines))).rstrip()
+    lines = [line.lstrip(" \t").rstrip() for line in lines]
+    return _NON_ASCII.sub("", "\n".join(filter(None, lines))).strip()
+
+
+CODE_KEYWORDS = (
+    "def ", "class ", "import ", "return ", "if ", "for ", "while ",
+    "print(", "=", ":", "(", ")", "{", "}", ";",
+)
+CODE_MIN_HITS = 3
+
+
+def code_hits(text, stop_at=None):
+    """Number of distinct code keywords in `text`, stopping early at stop_at.
+
+    Each keyword is a C-level substring search; on CPython that beats walking
+    the text character by character in Python, even with an automaton.
+    """
+    hits = 0
+    for keyword in CODE_KEYWORDS:
+        if keyword in text:
+            hits += 1
+            if hits == stop_at:
+                break
+    return hits
+
+
+def code_confidence(text):
+    """Share of the code keywords present in `text`, from 0.0 to 1.0."""
+    return code_hits(text) / len(CODE_KEYWORDS)
+
+
+def looks_like_code(text, min_hits=CODE_MIN_HITS):
+    """Detect if text looks like programming code."""
+    return code_hits(text, stop_at=min_hits) >= min_hits
@@ -0,0 +1,121 @@
+# uploads.py
+"""
+Uploaded files, spooled once and shared by every step that reads them.
+
+Streamlit hands the app an in-memory UploadedFile. Reading it with .read() or
+.getvalue() copies the whole file each time, and each Image.open() decodes it
+again. Upload writes the buffer to a temp file without copying it
+(BytesIO.getbuffer), maps that file read-only, and caches what is derived
+from it:
+
+    up = uploads.wrap(uploaded_file)   # no-op if it is already an Upload
+    up.view()                          # memoryview over the mapped file
+    up.path                            # for libraries that open by path (fitz, PyPDF2)
+    up.image()                         # decoded RGB image, decoded once
+    up.png_b64()                       # data-URI payload (PNG encoded once)
+    up.thumbnail_png(120)              # small preview, encoded once per size
+
+The temp file is removed when the Upload is garbage collected.
+"""
+import base64
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+from runtime import lazy_import
+
+
+def _cleanup(mapped, path):
+    try:
+        if mapped is not None:
+            mapped.close()
+    except BufferError:
+        pass  # a memoryview is still alive; the mapping goes when it does
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Upload:
+    def __init__(self, file):
+        self.name = file.name
+        self.type = getattr(file, "type", None)
+        self.file_id = getattr(file, "file_id", file.name)
+        fd, self.path = tempfile.mkstemp(prefix="upload-", suffix=os.path.splitext(file.name)[1])
+        with os.fdopen(fd, "wb") as out:
+            if hasattr(file, "getbuffer"):
+                with file.getbuffer() as buf:     # BytesIO: write without a bytes copy
+                    out.write(buf)
+            else:
+                file.seek(0)
+                shutil.copyfileobj(file, out)
+        self.size = os.path.getsize(self.path)
+        self._map = None
+        if self.size:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._finalizer = weakref.finalize(self, _cleanup, self._map, self.path)
+        self._digest = None
+        self._lock = threading.Lock()   # OCR and thumbnail encoding may run in parallel
+        self._image = None
+        self._png = None
+        self._thumbs = {}
+
+    def view(self):
+        return memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    def open(self):
+        """A fresh binary stream over the spooled file."""
+        return open(self.path, "rb")
+
+    def digest(self):
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.view()).hexdigest()
+        return self._digest
+
+    def image(self):
+        """The upload decoded as an RGB PIL image (decoded on first call only).
+
+        Shared by every caller: use .copy() before modifying it.
+        """
+        with self._lock:
+            if self._image is None:
+                with lazy_import("PIL.Image").open(self.path) as img:
+                    self._image = img.convert("RGB")
+        return self._image
+
+    def png(self):
+        if self._png is None and self.type == "image/png":
+            self._png = self.view().tobytes()     # already a PNG: no re-encode
+        if self._png is None:
+            buf = io.BytesIO()
+            self.image().save(buf, format="PNG")
+            self._png = buf.getvalue()
+        return self._png
+
+    def png_b64(self):
+        return base64.b64encode(self.png()).decode()
+
+    def thumbnail_png(self, width):
+        thumb = self._thumbs.get(width)
+        if thumb is None:
+            img = self.image().copy()
+            img.thumbnail((width, width * 4))
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            thumb = self._thumbs[width] = buf.getvalue()
+        return thumb
+
+    def close(self):
+        self._finalizer()
+
+
+def wrap(file):
+    """`file` as an Upload, spooling it only if it is not one already."""
+    return file if isinstance(file, Upload) else Upload(file)
@@ -1,18 +1,32 @@
 #streamlit_chat_ui.py
 import streamlit as st
 import datetime
-import requests
-from PIL import Image
-import pytesseract
-import io
+import os
+import time
+import archive
+import metrics
+import ollama_client
+import shared_store
+import uploads
+from chat_registry import ChatRegistry
+from conversation import Conversation, Message
+from model_router import classify
+from runtime import tesseract
 
 st.set_page_config(page_title="ChatGPT UI (Ollama + OCR)", layout="wide")
 
 # -------------------- Session State --------------------
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = Conversation()
 if "saved_chats" not in st.session_state:
-    st.session_state.saved_chats = []
+    # Empty unless served by serve.py (stored under their list position) or
+    # VAIDIC_CHATS_DIR names a directory to keep chats in between runs, one
+    # subdirectory per client
+    st.session_state.saved_chats = ChatRegistry(
+        shared_store.load_chats("vaidic").values(),
+        persist_dir=os.environ.get("VAIDIC_CHATS_DIR"),
+        client=shared_store.client_id(),
+    )
 if "active_chat" not in st.session_state:
     st.session_state.active_chat = None
 if "theme" not in st.session_state:
@@ -25,100 +39,114 @@ if "uploaded_images" not in st.session_state:
     st.session_state.uploaded_images = []
 if "preview_image" not in st.session_state:
     st.session_state.preview_image = None  # For enlarged image preview
-
-OLLAMA_URL = "http://localhost:11434"
-MODEL_NAME = "llama2"
+if "generation" not in st.session_state:
+    st.session_state.generation = None  # ollama_client.Generation while a reply streams
+if "ollama_context" not in st.session_state:
+    st.session_state.ollama_context = None  # KV context returned by /api/generate for the active chat
+if "ollama_model" not in st.session_state:
+    st.session_state.ollama_model = None  # model that produced ollama_context
+if "uploaded_ids" not in st.session_state:
+    st.session_state.uploaded_ids = ()  # files already OCRed, so idle reruns skip them
 
 # -------------------- Theme --------------------
-def apply_theme(theme):
-    if theme == "Dark":
-        st.markdown(
-            """
+THEME_CSS = {
+    "Dark": """
             <style>
             body { background-color: #0e1117; color: white; }
             div.stApp { background-color: #0e1117; color: white; }
             </style>
-            """, unsafe_allow_html=True
-        )
-    else:
-        st.markdown(
-            """
+            """,
+    "Light": """
             <style>
             body { background-color: white; color: black; }
             div.stApp { background-color: white; color: black; }
             </style>
-            """, unsafe_allow_html=True
-        )
+            """,
+}
 
-apply_theme(st.session_state.theme)
+def apply_theme(theme):
+    # Injected once per rerun, after the sidebar radio has settled the theme
+    st.markdown(THEME_CSS.get(theme, THEME_CSS["Light"]), unsafe_allow_html=True)
 
 # -------------------- Helper Functions --------------------
-def build_prompt(history):
+def build_prompt(history, ocr_texts):
     lines = []
-    if st.session_state.ocr_texts:
-        combined_ocr = "\n\n".join(st.session_state.ocr_texts)
+    if ocr_texts:
+        combined_ocr = "\n\n".join(ocr_texts)
         lines.append(f"The following text was extracted from uploaded images:\n{combined_ocr}\n")
     for m in history:
-        role = "User" if m["role"] == "user" else "Assistant"
-        lines.append(f"{role}: {m['content']}")
+        role = "User" if m.role == "user" else "Assistant"
+        lines.append(f"{role}: {m.content}")
     lines.append("Assistant:")
     return "\n".join(lines)
 
-def query_ollama_generate(prompt):
-    try:
-        payload = {"model": MODEL_NAME, "prompt": prompt, "stream": False}
-        resp = requests.post(f"{OLLAMA_URL}/api/generate", json=payload, timeout=120)
-        if resp.ok:
-            data = resp.json()
-            if "response" in data:
-                return data["response"]
-            if "message" in data and isinstance(data["message"], dict) and "content" in data["message"]:
-                return data["message"]["content"]
-            return str(data)
-        else:
-            return f"⚠️ Ollama error {resp.status_code}: {resp.text}"
-    except Exception as e:
-        return f"⚠️ Exception contacting Ollama: {e}"
+def build_turn(user_text):
+    # Only the new turn; everything before it is already in the model's context
+    return f"User: {user_text}\nAssistant:"
+
+def reset_context():
+    # History changed underneath the model: next send rebuilds the full prompt
+    st.session_state.ollama_context = None
+    st.session_state.ollama_model = None
 
 def save_current_chat():
     if st.session_state.messages:
-        title = st.session_state.messages[0]["content"][:30] + "..." if st.session_state.messages else "Untitled Chat"
-        if st.session_state.active_chat is None:
-            st.session_state.saved_chats.append({
-                "title": title,
-                "messages": list(st.session_state.messages)
-            })
-            st.session_state.active_chat = len(st.session_state.saved_chats) - 1
-        else:
-            st.session_state.saved_chats[st.session_state.active_chat]["messages"] = list(st.session_state.messages)
-            st.session_state.saved_chats[st.session_state.active_chat]["title"] = title
+        st.session_state.active_chat = st.session_state.saved_chats.save(
+            st.session_state.active_chat,
+            st.session_state.messages,
+            st.session_state.ollama_context,
+            st.session_state.ollama_model,
+        )
+
+def now():
+    return datetime.datetime.now().strftime("%H:%M")
+
+def finish_generation(job):
+    """Put the job's answer (or what it had so far) in place of the placeholder."""
+    st.session_state.generation = None
+    if job.error:
+        text = f"⚠️ {job.error}"
+    else:
+        text = job.text or "⏹ Stopped"
+    st.session_state.messages.replace_last(Message("assistant", text, time=now()))
+    if job.reply is not None and not job.cancelled:
+        st.session_state.ollama_context = job.reply.context
+        st.session_state.ollama_model = job.reply.model
+    else:
+        reset_context()
+    save_current_chat()
+
+def stop_generation():
+    job = st.session_state.generation
+    if job is not None:
+        job.stop()
+        finish_generation(job)
 
 def send_message(user_text=None):
     if user_text is None:
         user_text = st.session_state.user_input.strip()
     if not user_text:
         return
-    st.session_state.messages.append({
-        "role": "user",
-        "content": user_text,
-        "time": datetime.datetime.now().strftime("%H:%M")
-    })
+    # Sending again while a reply is still streaming supersedes it
+    stop_generation()
+    st.session_state.messages.add("user", user_text, time=now())
     st.session_state.user_input = ""
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": "⏳ Thinking...",
-        "time": datetime.datetime.now().strftime("%H:%M")
-    })
-    history = [m for m in st.session_state.messages if m["role"] in ("user", "assistant")]
-    prompt = build_prompt(history)
-    with st.spinner("Getting reply from Ollama..."):
-        reply = query_ollama_generate(prompt)
-    st.session_state.messages[-1] = {
-        "role": "assistant",
-        "content": reply,
-        "time": datetime.datetime.now().strftime("%H:%M")
-    }
-    save_current_chat()
+    st.session_state.messages.add("assistant", "⏳ Thinking...", time=now())
+    context = st.session_state.ollama_context
+    task = classify(user_text, has_attachment=bool(st.session_state.ocr_texts))
+    if context:
+        # Context tokens only make sense to the model that produced them
+        prompt = build_turn(user_text)
+        model = st.session_state.ollama_model
+    else:
+        history = [m for m in st.session_state.messages if m.role in ("user", "assistant")]
+        prompt = build_prompt(history, st.session_state.ocr_texts)
+        model = None
+    fields = {"context": context} if context else {}
+    # Streamed in the background and polled below, so Stop and a new send can cancel it
+    st.session_state.generation = ollama_client.Generation(
+        lambda cancel: ollama_client.generate_stream(prompt, task=task, model=model, cancel=cancel, **fields)
+    )
 
 # -------------------- Sidebar --------------------
 st.sidebar.title("⚙️ Menu")
@@ -126,66 +154,98 @@ st.session_state.theme = st.sidebar.radio("Choose Theme:", ["Light", "Dark"])
 apply_theme(st.session_state.theme)
 
 if st.sidebar.button("➕ New Chat"):
+    stop_generation()
     save_current_chat()
-    st.session_state.messages = []
+    st.session_state.messages = Conversation()
     st.session_state.active_chat = None
     st.session_state.ocr_texts = []
     st.session_state.uploaded_images = []
     st.session_state.preview_image = None
+    st.session_state.uploaded_ids = ()
+    reset_context()
 
 search_query = st.sidebar.text_input("🔍 Search chats")
 st.sidebar.subheader("💾 Chats")
-filtered_chats = [(i, chat) for i, chat in enumerate(st.session_state.saved_chats) if search_query.lower() in chat["title"].lower()]
+filtered_chats = st.session_state.saved_chats.search(search_query)
 for i, chat in filtered_chats:
     if st.sidebar.button(chat["title"], key=f"chat_{i}"):
+        stop_generation()
         save_current_chat()
-        st.session_state.messages = list(chat["messages"])
+        st.session_state.messages = chat["messages"].snapshot()
         st.session_state.active_chat = i
+        st.session_state.ollama_context = chat.get("context")
+        st.session_state.ollama_model = chat.get("model")
+
+def import_chat(chat):
+    # vaidic's own archives keep each chat's Ollama context and model
+    st.session_state.saved_chats.add(dict(chat, title=archive.title_of(chat)))
+
+archive.render_sidebar("vaidic", lambda: iter(st.session_state.saved_chats), import_chat)
+metrics.render_debug_panel()
+
+# -------------------- Background reply --------------------
+job = st.session_state.generation
+if job is not None:
+    if job.done:
+        finish_generation(job)
+    else:
+        st.session_state.messages.replace_last(Message("assistant", (job.text or "⏳ Thinking...") + " ▌", time=now()))
 
 # -------------------- Chat Container --------------------
 st.title("💬 ChatGPT - How can I help you...?")
 
 if st.session_state.messages:
     for msg in st.session_state.messages:
-        role = "🧑 You" if msg["role"] == "user" else "🤖 Assistant"
-        st.write(f"**{role}:** {msg['content']} ({msg['time']})")
+        role = "🧑 You" if msg.role == "user" else "🤖 Assistant"
+        st.write(f"**{role}:** {msg.content} ({msg.time})")
+    if st.session_state.generation is not None and st.button("⏹ Stop generating"):
+        stop_generation()
+        st.rerun()
 else:
     st.info("Start a new conversation by typing below 👇")
 
 # -------------------- Image Upload + OCR + Clickable Preview --------------------
+THUMB_WIDTH = 120  # px shown; the thumbnail is encoded at 2x for high-DPI screens
 uploaded_images = st.file_uploader("Upload Image(s) 📷", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
 
-if uploaded_images:
+upload_ids = tuple(getattr(img, "file_id", img.name) for img in uploaded_images or [])
+if uploaded_images and upload_ids != st.session_state.uploaded_ids:
+    st.session_state.uploaded_ids = upload_ids
     # ✅ Clear previous images and OCR text to prevent duplicates
+    previous_ocr = st.session_state.ocr_texts
     st.session_state.uploaded_images = []
     st.session_state.ocr_texts = []
 
     for img in uploaded_images:
-        image = Image.open(img)
-        st.session_state.uploaded_images.append(image)
-        extracted_text = pytesseract.image_to_string(image).strip()
+        upload = uploads.Upload(img)
+        st.session_state.uploaded_images.append(upload)
+        with metrics.stage("ocr", file=img.name):
+            extracted_text = tesseract().image_to_string(upload.image()).strip()
         if extracted_text:
             st.session_state.ocr_texts.append(extracted_text)
 
+    # OCR text sits at the top of the prompt, so new text invalidates the cached context
+    if st.session_state.ocr_texts != previous_ocr:
+        reset_context()
+
     st.success(f"✅ {len(uploaded_images)} image(s) processed successfully! OCR text stored internally.")
 
 # Show image thumbnails (only once per upload)
 if st.session_state.uploaded_images:
     st.markdown("### 🖼️ Uploaded Images")
     cols = st.columns(len(st.session_state.uploaded_images))
-    for i, image in enumerate(st.session_state.uploaded_images):
+    for i, upload in enumerate(st.session_state.uploaded_images):
         with cols[i]:
-            buf = io.BytesIO()
-            image.save(buf, format="PNG")
             btn = st.button(f"🖼️ Preview {i+1}")
-            st.image(buf.getvalue(), width=120)
+            # encoded once per upload, not on every rerun
+            st.image(upload.thumbnail_png(THUMB_WIDTH * 2), width=THUMB_WIDTH)
             if btn:
-                st.session_state.preview_image = image
+                st.session_state.preview_image = upload
 
 # Show enlarged image if selected
 if st.session_state.preview_image:
     st.markdown("### 🔍 Image Preview (Click Close to return)")
-    st.image(st.session_state.preview_image, use_container_width=True)
+    st.image(st.session_state.preview_image.path, use_container_width=True)
     if st.button("❌ Close Preview"):
         st.session_state.preview_image = None
 
@@ -201,3 +261,12 @@ if st.session_state.ocr_texts:
 # -------------------- Message Input --------------------
 st.text_input("Type your message:", key="user_input", on_change=send_message)
 st.button("Send", on_click=send_message)
+
+# -------------------- Persist (multi-worker deployments, see serve.py) --------------------
+changed = st.session_state.saved_chats.flush()
+shared_store.sync_chats("vaidic", st.session_state.saved_chats.as_dict(), only={str(i) for i in changed})
+
+# -------------------- Poll the background reply --------------------
+if st.session_state.generation is not None:
+    time.sleep(0.3)
+    st.rerun()